@@ -3,104 +3,139 @@ import geopandas
 import datetime as dt
 import numpy as np
 import os
-from tensorflow import keras
+import sys
 import matplotlib.pyplot as plt
 
 import osmnx as ox
 import networkx as nx
 from shapely.geometry import Point
 
+sys.path.append('../Optimisation/')
+from rendering import EdgeSegments, BaseMap, Renderer
+from interpolation import edge_midpoints, EdgeInterpolator
+from trip_store import TripStore
+
 import warnings
 warnings.filterwarnings("ignore")
 
 # ----- PARAMS
 subject_list = ['A', 'B', 'C', 'D', 'E']
-model = keras.models.load_model('../MY Monitoring/deep_model2')
-
-# load the travel graph, project to coordinate space and intialise PM2.5 characteristics to 0
-G = ox.load_graphml('../Mapping/data/London.graphml')
-nodes, edges = ox.graph_to_gdfs(G)
-G = ox.project_graph(G, to_crs='4326') 
-edges['Mean PM2.5'] = np.nan
-edges['PM2.5 Count'] = 0
-print(f'Loaded graph success.')
-
-log = pd.DataFrame(columns=['subject', 'file', 'date', 'commute', 'min', 'Q25', 'mean', 'Q75', 'max'])
-
-# for every subject, calibrate each journey and create plots of the calbration, and a heatmap of the journey
-# also aggregate calibrated PM2.5 measurements as graph attributes
-for subject in subject_list:
-    print(subject)
-    directory = os.path.join(subject+'/Cleaned/')
-    for root,dirs,files in os.walk(directory):
-        for file in files:
-            if file.endswith(".csv"):
-                raw_data = pd.read_csv(directory+file)
-
-                model_df = raw_data.set_index('WriteTime')
-                model_df.index = pd.to_datetime(model_df.index)
-                model_df.rename(columns={'Temp': 'Temperature', 'RH': 'Relative Humidity'}, inplace=True)
-
-                model_df['Delay'] = model_df['PM2.5'].shift(periods=1)
-                model_df['Hour'] = model_df.index.hour
-                model_df['Day'] = model_df.index.weekday
-                model_df.dropna(inplace=True)
-
-                lats = model_df['Lat'].to_list()
-                lngs = model_df['Lng'].to_list()
-                train_df = model_df[['Temperature','Relative Humidity','PM2.5','PM10', 'Delay', 'Hour', 'Day']]
-
-                model_df['Calibrated PM2.5'] = model.predict(train_df)
-                model_df.loc[model_df['Calibrated PM2.5'] > 85.0, 'Calibrated PM2.5'] = 85.0
-                model_df.to_csv(subject+'/Calibrated/'+file)
-
-                log_data = {'subject': subject, 'file': file, 'date': model_df.index[0], 'commute': file[4:6],
-                            'min': model_df['Calibrated PM2.5'].min(), 'Q25': model_df['Calibrated PM2.5'].quantile(q=0.25),
-                            'mean': model_df['Calibrated PM2.5'].mean(), 'Q75': model_df['Calibrated PM2.5'].quantile(q=0.75),
-                            'max': model_df['Calibrated PM2.5'].max()}
-                log = log.append(log_data, ignore_index=True)
-
-                # plot raw and calibrated data
-                ax = model_df[['PM2.5', 'Calibrated PM2.5']].plot(ylabel='PM2.5, ug/m3', figsize=(18,12), color=['gray','blue'])
-                fig = ax.get_figure()
-                fig.savefig(subject+'/img/'+file[:-4]+'_calibrated.png', dpi=300, bbox_inches='tight')
+export_csv = False # also write calibrated commutes as CSV
+
+# rendering processes are spawned and import this script, so only the definitions above run in them
+if __name__ == '__main__':
+    # imported here so the spawned rendering processes do not load TensorFlow
+    from tensorflow import keras
+    model = keras.models.load_model('../MY Monitoring/deep_model2')
+
+    # load the travel graph, project to coordinate space and intialise PM2.5 characteristics to 0
+    G = ox.load_graphml('../Mapping/data/London.graphml')
+    nodes, edges = ox.graph_to_gdfs(G)
+    G = ox.project_graph(G, to_crs='4326') 
+    edges['Mean PM2.5'] = np.nan
+    edges['PM2.5 Count'] = 0
+    edges['Interpolated PM2.5'] = np.nan
+    # per-edge hourly PM2.5, in graph edge order, for time-dependent routing
+    hourly_sum = np.zeros((len(edges), 24), dtype=np.float32)
+    hourly_count = np.zeros((len(edges), 24), dtype=np.uint16)
+    # spatial interpolation of the aggregate onto unmeasured edges, updated after every commute
+    interpolator = EdgeInterpolator(edge_midpoints(edges), k=8, power=2)
+    print(f'Loaded graph success.')
+
+    # rasterise the street base layer once and draw heatmaps on top of it in the background
+    segments = EdgeSegments.from_gdf(edges)
+    renderer = Renderer(BaseMap(segments, figsize=(18,12), dpi=300, color='dimgray', linewidth=0.5))
+
+    log = pd.DataFrame(columns=['subject', 'file', 'date', 'commute', 'min', 'Q25', 'mean', 'Q75', 'max'])
+
+    # for every subject, calibrate each journey and create plots of the calbration, and a heatmap of the journey
+    # also aggregate calibrated PM2.5 measurements as graph attributes
+    for subject in subject_list:
+        print(subject)
+        directory = os.path.join(subject+'/Cleaned/')
+        cleaned = TripStore(directory)
+        cleaned.import_csv(directory) # commutes cleaned to CSV before the trip store existed
+        calibrated = TripStore(subject+'/Calibrated/')
+        for name in cleaned.names:
+            file = name+'.csv'
+            model_df = cleaned.read(name)
+            model_df.rename(columns={'Temp': 'Temperature', 'RH': 'Relative Humidity'}, inplace=True)
+
+            model_df['Delay'] = model_df['PM2.5'].shift(periods=1)
+            model_df['Hour'] = model_df.index.hour
+            model_df['Day'] = model_df.index.weekday
+            model_df.dropna(inplace=True)
+
+            lats = model_df['Lat'].to_list()
+            lngs = model_df['Lng'].to_list()
+            train_df = model_df[['Temperature','Relative Humidity','PM2.5','PM10', 'Delay', 'Hour', 'Day']]
+
+            model_df['Calibrated PM2.5'] = model.predict(train_df)
+            model_df.loc[model_df['Calibrated PM2.5'] > 85.0, 'Calibrated PM2.5'] = 85.0
+            calibrated.write(name, model_df)
+            if export_csv:
+                calibrated.to_csv(name, subject+'/Calibrated/'+file)
+
+            log_data = {'subject': subject, 'file': file, 'date': model_df.index[0], 'commute': file[4:6],
+                        'min': model_df['Calibrated PM2.5'].min(), 'Q25': model_df['Calibrated PM2.5'].quantile(q=0.25),
+                        'mean': model_df['Calibrated PM2.5'].mean(), 'Q75': model_df['Calibrated PM2.5'].quantile(q=0.75),
+                        'max': model_df['Calibrated PM2.5'].max()}
+            log = log.append(log_data, ignore_index=True)
+
+            # plot raw and calibrated data
+            ax = model_df[['PM2.5', 'Calibrated PM2.5']].plot(ylabel='PM2.5, ug/m3', figsize=(18,12), color=['gray','blue'])
+            fig = ax.get_figure()
+            fig.savefig(subject+'/img/'+file[:-4]+'_calibrated.png', dpi=300, bbox_inches='tight')
+            plt.close(fig)
                 
-                # fit GPS measurements to the graph
-                points_list = [Point((lng, lat)) for lat, lng in zip(lats, lngs)]
-                points = geopandas.GeoSeries(points_list, crs='epsg:4326')
-                nearest_edges = ox.nearest_edges(G, [pt.x for pt in points], [pt.y for pt in points])
-                pts = geopandas.GeoDataFrame({'Geometry': points, 'Nearest Edge': nearest_edges, 'PM2.5': model_df['Calibrated PM2.5'].to_list()})
-
-                edge_pollute = pts.groupby(['Nearest Edge']).first()
-                edge_pollute['PM2.5'] = pts.groupby(['Nearest Edge']).mean()
-                edge_pollute.index = pd.MultiIndex.from_tuples(edge_pollute.index, names=('u', 'v', 'key'))
-
-                # aggregate calibrated data with edge PM2.5 metrics 
-                edges['PM2.5'] = np.nan
-                edges.loc[edge_pollute.index, 'PM2.5'] = edge_pollute['PM2.5']
-                for idx in edge_pollute.index:
-                    if edges.loc[idx, 'PM2.5 Count'] != 0:
-                        edges.loc[idx, 'Mean PM2.5'] = (edges.loc[idx, 'Mean PM2.5']*edges.loc[idx, 'PM2.5 Count'] + edge_pollute.loc[idx, 'PM2.5']) / (edges.loc[idx, 'PM2.5 Count'] + 1)
-                    else:
-                        edges.loc[idx, 'Mean PM2.5'] = edge_pollute.loc[idx, 'PM2.5']
-                    edges.loc[idx, 'PM2.5 Count'] += 1
-
-                # plot individual commute heatmap
-                fig, ax = plt.subplots(figsize=(18,12))
-                ax.set_axis_off()
-                edges.plot(ax=ax, linewidth=0.5, edgecolor='dimgray')
-                edges.loc[pts['Nearest Edge']].plot(ax=ax, linewidth=1.5, column='PM2.5', cmap='inferno', legend=True, vmax=model_df['Calibrated PM2.5'].quantile(q=0.9),
-                                                    legend_kwds={'label': "PM2.5 (ug / m3)", 'orientation': "horizontal"})
-                fig.savefig(subject+'/img/'+file[:-4]+'_calibrated_route.png', dpi=300, bbox_inches='tight', transparent=True)
-
-# plot aggregated commute heatmap
-fig, ax = plt.subplots(figsize=(18,12))
-ax.set_axis_off()
-edges.plot(ax=ax, linewidth=0.5, edgecolor='dimgray')
-edges[edges['Mean PM2.5'] != np.nan].plot(ax=ax, linewidth=1.5, column='Mean PM2.5', cmap='inferno', legend=True, vmax=17.5,
-                                          legend_kwds={'label': "PM2.5 (ug / m3)", 'orientation': "horizontal"})
-fig.savefig('ldn_heatmap.png', dpi=300, bbox_inches='tight', transparent=True)
-
-# save calibration log
-log.sort_values(by=['file'], inplace=True)
-log.to_csv('calibration_log.csv')
\ No newline at end of file
+            # fit GPS measurements to the graph
+            points_list = [Point((lng, lat)) for lat, lng in zip(lats, lngs)]
+            points = geopandas.GeoSeries(points_list, crs='epsg:4326')
+            nearest_edges = ox.nearest_edges(G, [pt.x for pt in points], [pt.y for pt in points])
+            pts = geopandas.GeoDataFrame({'Geometry': points, 'Nearest Edge': nearest_edges, 'PM2.5': model_df['Calibrated PM2.5'].to_list()})
+
+            edge_pollute = pts.groupby(['Nearest Edge']).first()
+            edge_pollute['PM2.5'] = pts.groupby(['Nearest Edge']).mean()
+            edge_pollute.index = pd.MultiIndex.from_tuples(edge_pollute.index, names=('u', 'v', 'key'))
+
+            # aggregate calibrated data with edge PM2.5 metrics 
+            edges['PM2.5'] = np.nan
+            edges.loc[edge_pollute.index, 'PM2.5'] = edge_pollute['PM2.5']
+            for idx in edge_pollute.index:
+                if edges.loc[idx, 'PM2.5 Count'] != 0:
+                    edges.loc[idx, 'Mean PM2.5'] = (edges.loc[idx, 'Mean PM2.5']*edges.loc[idx, 'PM2.5 Count'] + edge_pollute.loc[idx, 'PM2.5']) / (edges.loc[idx, 'PM2.5 Count'] + 1)
+                else:
+                    edges.loc[idx, 'Mean PM2.5'] = edge_pollute.loc[idx, 'PM2.5']
+                edges.loc[idx, 'PM2.5 Count'] += 1
+
+            # aggregate calibrated data by the hour in which each edge was travelled
+            pts['Hour'] = model_df.index.hour
+            edge_hour = pts.groupby(['Nearest Edge', 'Hour'])['PM2.5'].mean()
+            pos = edges.index.get_indexer(pd.MultiIndex.from_tuples(edge_hour.index.get_level_values(0)))
+            hours = edge_hour.index.get_level_values(1).to_numpy()
+            np.add.at(hourly_sum, (pos, hours), edge_hour.values)
+            np.add.at(hourly_count, (pos, hours), 1)
+
+            # requery only edges near newly measured ones
+            edges['Interpolated PM2.5'] = interpolator.update(edges['Mean PM2.5'].values.astype(float), edges['PM2.5 Count'].values)
+
+            # plot individual commute heatmap
+            idx = edges.index.get_indexer(edge_pollute.index)
+            renderer.heatmap(subject+'/img/'+file[:-4]+'_calibrated_route.png', segments.lines(idx), edges['PM2.5'].values[idx],
+                             vmax=model_df['Calibrated PM2.5'].quantile(q=0.9))
+
+    # plot aggregated commute heatmap
+    idx = np.flatnonzero(edges['Mean PM2.5'].notna().values)
+    renderer.heatmap('ldn_heatmap.png', segments.lines(idx), edges['Mean PM2.5'].values[idx], vmax=17.5)
+    renderer.heatmap('ldn_heatmap_interpolated.png', segments.lines(), edges['Interpolated PM2.5'].values, vmax=17.5)
+    renderer.close()
+
+    # save hourly edge PM2.5 aggregates
+    np.savez('hourly_pm.npz', sum=hourly_sum, count=hourly_count)
+
+    # save interpolated edge PM2.5, in graph edge order, for routing on a per-edge ambient concentration
+    np.save('edge_pm.npy', edges['Interpolated PM2.5'].values.astype(np.float32))
+
+    # save calibration log
+    log.sort_values(by=['file'], inplace=True)
+    log.to_csv('calibration_log.csv')
\ No newline at end of file
@@ -5,11 +5,14 @@ import numpy as np
 import gpxpy
 import gpxpy.gpx
 
+from trip_store import TripStore
+
 # ----- PARAMS
 subject = 'E'
 raw_data_file = 'input.csv'
 gpx_name = '0706AM.gpx'
 true_time = dt.datetime(2022, 6, 7, 9, 24, 0) # can be found from Strava log - for subject B add 1H for BST
+export_csv = False # also write the cleaned commute as CSV
 
 # populate the dataframe with the raw commute data
 df = pd.read_csv(subject+'/'+raw_data_file)
@@ -61,9 +64,11 @@ for track in gpx.tracks:
                 df.loc[idx, 'Lat'] = point.latitude
                 df.loc[idx, 'Lng'] = point.longitude
 
-# remove any remaining invalid GPS data and save the cleaned file
+# remove any remaining invalid GPS data and store the cleaned commute
 df = df.drop(df[df['Lat'] == 0.0].index)
-df.to_csv(subject+"/Cleaned/"+gpx_name[:-4]+".csv")
+TripStore(subject+"/Cleaned").write(gpx_name[:-4], df)
+if export_csv:
+    df.to_csv(subject+"/Cleaned/"+gpx_name[:-4]+".csv")
 
 # write summary information to the log
 with open(subject+"/log.txt", "a+") as f:
@@ -0,0 +1,157 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+# columns kept at double precision, float32 would round GPS fixes to ~1 m
+float64_columns = ('Lat', 'Lng')
+
+class TripStore:
+    '''
+    A directory of commute records stored column by column as memory-mapped .npy files.
+
+    Each trip is a subdirectory holding one file per column, plus WriteTime as native
+    datetime64 timestamps. Sensor columns are stored as float32. manifest.json lists
+    every trip with its row count, time span and column types, so readers can select
+    columns and scan many trips without parsing text.
+    '''
+    def __init__(self, root):
+        '''
+                Parameters:
+                        root (str): Directory of the store, e.g. 'A/Cleaned'
+        '''
+        self.root = root
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'trips': {}}
+
+    @property
+    def names(self):
+        '''
+        Returns the name of every trip, in time order.
+        '''
+        return sorted(self.manifest['trips'], key=lambda name: (self.manifest['trips'][name]['start'], name))
+
+    def __len__(self):
+        return len(self.manifest['trips'])
+
+    def __contains__(self, name):
+        return name in self.manifest['trips']
+
+    def save_manifest(self):
+        '''
+        Writes the manifest, replacing the previous one only once it is complete.
+        '''
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    def write(self, name, df):
+        '''
+        Stores a trip, replacing any trip of the same name.
+
+                Parameters:
+                        name (str): Trip name, e.g. '0706AM'
+                        df (pd.DataFrame): Commute records indexed by WriteTime
+        '''
+        trip_dir = os.path.join(self.root, name)
+        os.makedirs(trip_dir, exist_ok=True)
+        index = pd.DatetimeIndex(df.index)
+        np.save(os.path.join(trip_dir, 'WriteTime.npy'), index.values.astype('datetime64[ns]'))
+
+        columns = {}
+        for column in df.columns:
+            values = df[column].to_numpy()
+            if values.dtype.kind == 'f':
+                values = values.astype(np.float64 if column in float64_columns else np.float32)
+            elif values.dtype.kind not in 'iub':
+                raise ValueError(f"Column {column} of trip {name} has unsupported type {values.dtype}")
+            np.save(os.path.join(trip_dir, column + '.npy'), values)
+            columns[column] = values.dtype.str
+
+        self.manifest['trips'][name] = {'rows': len(df), 'columns': columns,
+                                        'start': str(index[0]) if len(index) else '', 'end': str(index[-1]) if len(index) else ''}
+        self.save_manifest()
+
+    def column(self, name, column):
+        '''
+        Returns a read-only memory map of one column of a trip.
+        '''
+        return np.load(os.path.join(self.root, name, column + '.npy'), mmap_mode='r')
+
+    def read(self, name, columns=None):
+        '''
+        Returns a trip as a DataFrame indexed by WriteTime.
+
+                Parameters:
+                        name (str): Trip name
+                        columns (list of str): Columns to load, all if None
+
+                Returns:
+                        df (pd.DataFrame): The trip's records
+        '''
+        if columns is None:
+            columns = list(self.manifest['trips'][name]['columns'])
+        index = pd.DatetimeIndex(np.array(self.column(name, 'WriteTime')), name='WriteTime')
+        return pd.DataFrame({c: np.array(self.column(name, c)) for c in columns}, index=index)
+
+    def scan(self, names=None, columns=None):
+        '''
+        Returns many trips as a single DataFrame with a 'Trip' column, filled into preallocated arrays.
+
+                Parameters:
+                        names (list of str): Trips to load, all if None
+                        columns (list of str): Columns to load, all columns of the first trip if None
+
+                Returns:
+                        df (pd.DataFrame): Records of every trip, indexed by WriteTime
+        '''
+        if names is None:
+            names = self.names
+        if not names:
+            return pd.DataFrame(columns=columns or [])
+        trips = self.manifest['trips']
+        if columns is None:
+            columns = list(trips[names[0]]['columns'])
+        rows = np.array([trips[n]['rows'] for n in names], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(rows)])
+
+        index = np.empty(offsets[-1], dtype='datetime64[ns]')
+        data = {c: np.empty(offsets[-1], dtype=np.dtype(trips[names[0]]['columns'][c])) for c in columns}
+        for n, start, end in zip(names, offsets[:-1], offsets[1:]):
+            index[start:end] = self.column(n, 'WriteTime')
+            for c in columns:
+                data[c][start:end] = self.column(n, c)
+
+        df = pd.DataFrame(data, index=pd.DatetimeIndex(index, name='WriteTime'))
+        df['Trip'] = pd.Categorical.from_codes(np.repeat(np.arange(len(names)), rows), categories=names)
+        return df
+
+    def to_csv(self, name, path):
+        '''
+        Exports a trip to CSV, in the layout written by the original scripts.
+        '''
+        self.read(name).to_csv(path)
+
+    def import_csv(self, directory):
+        '''
+        Stores every CSV trip of a directory not yet in the store, e.g. records cleaned before the store existed.
+
+                Parameters:
+                        directory (str): Directory of CSV files indexed by WriteTime
+
+                Returns:
+                        names (list of str): Trips imported
+        '''
+        imported = []
+        for file in sorted(os.listdir(directory)):
+            if file.endswith('.csv') and file[:-4] not in self:
+                df = pd.read_csv(os.path.join(directory, file), index_col='WriteTime', parse_dates=['WriteTime'])
+                self.write(file[:-4], df)
+                imported.append(file[:-4])
+        return imported
@@ -0,0 +1,156 @@
+import io
+import os
+import sys
+import json
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../Commute Monitoring/'))
+from trip_store import TripStore
+
+# weather API columns duplicated in other units or not used as features
+weather_drop = ['timestamp','last_updated_epoch', 'feelslike_f', 'gust_mph', 'precip_in', 'pressure_in', 'temp_f', 'vis_miles', 'wind_dir', 'wind_mph']
+
+def read_new_rows(path, offset, header):
+    '''
+    Returns the rows appended to a CSV file since a byte offset, without reparsing earlier rows.
+
+            Parameters:
+                    path (str): CSV file, only ever appended to
+                    offset (int): Byte offset up to which the file has been read, 0 for none
+                    header (str): Header line of the file, read from the file if offset is 0
+
+            Returns:
+                    rows (pd.DataFrame): Complete rows after the offset
+                    offset (int): Byte offset after the last complete row
+                    header (str): Header line of the file
+    '''
+    with open(path, 'rb') as f:
+        if offset == 0:
+            header = f.readline().decode()
+            offset = f.tell()
+        f.seek(offset)
+        text = f.read()
+    end = text.rfind(b'\n') + 1 # a partly written last row is left for the next update
+    if end == 0:
+        return pd.DataFrame(), offset, header
+    return pd.read_csv(io.StringIO(header + text[:end].decode())), offset + end, header
+
+def clean_weather(weather):
+    '''
+    Returns raw weather records indexed by update time, with one indicator column per condition.
+    '''
+    weather['last_updated'] = pd.to_datetime(weather['last_updated'])
+    weather = weather.drop(columns=weather_drop, errors='ignore').set_index('last_updated')
+    return pd.get_dummies(weather, columns=['condition'], dtype=np.uint8)
+
+def clean_pm(data):
+    '''
+    Returns raw PM monitor results indexed by time, with unparseable values as NaN.
+    '''
+    data['Time'] = pd.to_datetime(data['Time'])
+    return data.set_index('Time').apply(pd.to_numeric, errors='coerce')
+
+def append_raw(old, new):
+    '''
+    Returns the time-sorted union of stored and new raw records, keeping the first record of any time.
+    '''
+    df = pd.concat([old, new]) if len(old) else new
+    df = df[~df.index.duplicated(keep='first')].sort_index()
+    indicators = [c for c in df.columns if c.startswith('condition_')]
+    df[indicators] = df[indicators].fillna(0).astype(np.uint8) # conditions first seen in the new rows
+    return df
+
+class HourlyFeatureStore:
+    '''
+    The hourly join of the weather and PM monitor records, persisted and extended as the source files grow.
+
+    Raw records of both sources are kept in a TripStore with the byte offset read from
+    each file, so an update parses only the rows appended since, and recomputes only the
+    hours from the earliest new record onwards.
+    '''
+    def __init__(self, root, weather_file='MY_weatherdata.csv', pm_file='results 17 5.csv'):
+        '''
+                Parameters:
+                        root (str): Directory of the feature store
+                        weather_file (str): Weather API log, CSV
+                        pm_file (str): PM monitor results, CSV
+        '''
+        os.makedirs(root, exist_ok=True)
+        self.store = TripStore(root)
+        self.sources = {'weather': (weather_file, clean_weather), 'pm': (pm_file, clean_pm)}
+        self.state_path = os.path.join(root, 'sources.json')
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+        else:
+            self.state = {}
+
+    def load(self, name):
+        '''
+        Returns a stored table, empty if it has not been written.
+        '''
+        return self.store.read(name) if name in self.store else pd.DataFrame()
+
+    def update(self):
+        '''
+        Reads new source rows and recomputes the affected hours of the joined dataset.
+
+                Returns:
+                        added (int): Number of new raw records
+        '''
+        raw, first, added = {}, [], 0
+        for name, (path, clean) in self.sources.items():
+            state = self.state.get(name, {'path': path, 'offset': 0, 'header': ''})
+            old = self.load(name + '_raw')
+            if state['path'] != path or os.path.getsize(path) < state['offset']:
+                state, old = {'path': path, 'offset': 0, 'header': ''}, pd.DataFrame() # source replaced, rebuild
+            rows, state['offset'], state['header'] = read_new_rows(path, state['offset'], state['header'])
+            self.state[name] = state
+            raw[name] = old
+            if len(rows):
+                new = clean(rows)
+                first.append(new.index.min())
+                raw[name] = append_raw(old, new)
+                self.store.write(name + '_raw', raw[name])
+                added += len(new)
+        if not added or not all(len(df) for df in raw.values()):
+            self.save_state()
+            return added
+
+        # hours from the earliest new record onwards, padding weather from the record before
+        start = min(first).floor('1h')
+        weather = raw['weather']
+        weather = weather.iloc[max(weather.index.searchsorted(start) - 1, 0):]
+        weather = weather.resample('1h').ffill().loc[start:]
+        pm = raw['pm'].loc[start:].resample('1h').mean()
+        hours = pd.concat([pm, weather], axis=1, join='inner')
+
+        hourly = self.load('hourly')
+        hourly = pd.concat([hourly[hourly.index < start], hours]) if len(hourly) else hours
+        indicators = [c for c in hourly.columns if c.startswith('condition_')]
+        hourly[indicators] = hourly[indicators].fillna(0).astype(np.uint8)
+        self.store.write('hourly', hourly)
+        self.save_state()
+        return added
+
+    def save_state(self):
+        '''
+        Writes the byte offset read from each source, once the rows up to it are stored.
+        '''
+        with open(self.state_path, 'w') as f:
+            json.dump(self.state, f, indent=1)
+
+    def hourly(self, columns=None):
+        '''
+        Returns the joined hourly dataset, updating it from the source files first.
+
+                Parameters:
+                        columns (list of str): Columns to load, all if None
+
+                Returns:
+                        data (pd.DataFrame): Hourly PM monitor and weather features
+        '''
+        self.update()
+        return self.store.read('hourly', columns)
@@ -0,0 +1,173 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from sklearn.metrics import mean_absolute_percentage_error, mean_squared_error
+from sklearn.model_selection import TimeSeriesSplit
+import tensorflow as tf
+from tensorflow.keras import layers
+
+def lin_model(norm, train_features, loss_func):
+    '''
+    Returns a compiled linear model.
+
+            Parameters:
+                norm (tf.layers.Normalization): Adapted normalization filter
+                train_features (list of str): List of features to train on
+                loss_func (str): Name of the loss function to use
+
+            Returns:
+                model (tf.model): Compiled linear model
+    '''
+    linear_model = tf.keras.Sequential([norm, layers.Dense(units=1)])
+    linear_model.predict(train_features)
+    linear_model.compile(optimizer = tf.optimizers.Adam(learning_rate=0.1), loss=loss_func)
+    return linear_model
+
+def deep_model(norm, train_features, loss_func):
+    '''
+    Returns a compiled deep model.
+
+            Parameters:
+                norm (tf.layers.Normalization): Adapted normalization filter
+                train_features (list of str): List of features to train on
+                loss_func (str): Name of the loss function to use
+
+            Returns:
+                model (tf.model): Compiled deep model
+    '''
+    if len(train_features.columns) > 10:
+        model = tf.keras.Sequential([
+            norm,
+            layers.Dense(64, activation='relu'),
+            layers.BatchNormalization(),
+            layers.Dense(64, activation='relu'),
+            layers.BatchNormalization(),
+            layers.Dense(64, activation='relu'),
+            layers.BatchNormalization(),
+            layers.Dense(64, activation='relu'),
+            layers.BatchNormalization(),
+            layers.Dense(64, activation='relu'),
+            layers.BatchNormalization(),
+            layers.Dense(64, activation='relu'),
+            layers.BatchNormalization(),
+            layers.Dense(64, activation='relu'),
+            layers.BatchNormalization(),
+            layers.Dense(64, activation='relu'),
+            layers.Dense(1)
+            ])
+    else:
+        model = tf.keras.Sequential([
+            norm,
+            layers.Dense(64, activation='relu'),
+            layers.BatchNormalization(),
+            layers.Dense(64, activation='relu'),
+            layers.BatchNormalization(),
+            layers.Dense(64, activation='relu'),
+            layers.BatchNormalization(),
+            layers.Dense(64, activation='relu'),
+            layers.Dense(1)
+            ])
+    model.predict(train_features)
+    model.compile(optimizer = tf.optimizers.Adam(learning_rate=0.0005), loss=loss_func)
+    return model
+
+# candidate architectures, by the mode names used in regression()
+builders = {'linear': lin_model, 'deep': deep_model}
+
+def early_stopping(patience):
+    '''
+    Returns a callback stopping training once the validation loss has not improved for a number of epochs.
+    '''
+    return tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=patience, restore_best_weights=True)
+
+def init_worker(threads):
+    '''
+    Limits the threads of each training process, so parallel folds do not oversubscribe the cores.
+    '''
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def train_fold(mode, fold, columns, train, test, loss_func, max_epochs, patience, val_frac, seed):
+    '''
+    Trains one candidate on one fold and returns its test scores.
+
+    The last val_frac of the training rows, in time order, is held out for early stopping.
+
+            Parameters:
+                mode (str): Candidate in builders, e.g. 'deep'
+                fold (int): Fold number
+                columns (list of str): Feature names
+                train (tuple of np.ndarray): Training features and labels
+                test (tuple of np.ndarray): Test features and labels
+                loss_func (str): Name of the loss function
+                max_epochs (int): Epoch limit
+                patience (int): Epochs without validation improvement before stopping
+                val_frac (float): Fraction of the training rows used for validation
+                seed (int): Random seed of the weight initialisation
+
+            Returns:
+                scores (dict): RMSE and MAPE on the test rows, and the epochs trained
+    '''
+    tf.keras.utils.set_random_seed(seed)
+    (x, y), (x_test, y_test) = train, test
+    n_val = max(int(len(x) * val_frac), 1)
+    x_train = pd.DataFrame(x[:-n_val], columns=columns)
+    x_val, y_train, y_val = x[-n_val:], y[:-n_val], y[-n_val:]
+
+    normalizer = tf.keras.layers.Normalization(axis=-1)
+    normalizer.adapt(np.array(x_train))
+    model = builders[mode](normalizer, x_train, loss_func)
+    history = model.fit(x_train, y_train, epochs=max_epochs, verbose=0, validation_data=(x_val, y_val), callbacks=[early_stopping(patience)])
+
+    predictions = model.predict(x_test, verbose=0).flatten()
+    return {'mode': mode, 'fold': fold, 'train': len(x), 'test': len(x_test), 'epochs': len(history.history['loss']),
+            'RMSE': np.sqrt(mean_squared_error(y_test, predictions)), 'MAPE': mean_absolute_percentage_error(y_test, predictions)}
+
+def cross_validate(df, y_col, modes=('linear', 'deep'), n_folds=5, workers=None, loss_func='mean_squared_error', max_epochs=500, patience=20, val_frac=0.2, seed=0):
+    '''
+    Returns the per-fold scores of every candidate under expanding-window time-series cross-validation.
+
+    Each fold trains on all hours before its test block, so no model sees the future.
+    Every (candidate, fold) pair is trained in its own worker process.
+
+            Parameters:
+                df (pd.DataFrame): Time-ordered features including the target column
+                y_col (str): Target column for the models to learn
+                modes (tuple of str): Candidates in builders
+                n_folds (int): Number of test blocks
+                workers (int): Training processes, one per core if None
+                loss_func (str): Name of the loss function
+                max_epochs (int): Epoch limit of every fit
+                patience (int): Epochs without validation improvement before stopping
+                val_frac (float): Fraction of each training window used for early stopping
+                seed (int): Random seed of the weight initialisation
+
+            Returns:
+                results (pd.DataFrame): One row of scores per candidate and fold
+    '''
+    df = df.dropna().sort_index()
+    y = df[y_col].to_numpy(dtype=np.float32)
+    x = df.drop(columns=[y_col]).to_numpy(dtype=np.float32)
+    columns = [c for c in df.columns if c != y_col]
+
+    jobs = len(modes) * n_folds
+    workers = min(workers or os.cpu_count(), jobs)
+    threads = max(os.cpu_count() // workers, 1)
+    # TensorFlow is not fork-safe, so workers are spawned, re-importing the calling script as __mp_main__, which needs a __main__ guard
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_worker, initargs=(threads,)) as pool:
+        futures = [pool.submit(train_fold, mode, fold, columns, (x[train], y[train]), (x[test], y[test]), loss_func, max_epochs, patience, val_frac, seed)
+                   for fold, (train, test) in enumerate(TimeSeriesSplit(n_splits=n_folds).split(x))
+                   for mode in modes]
+        results = [f.result() for f in futures]
+    return pd.DataFrame(results)
+
+def summarise(results):
+    '''
+    Returns the mean and standard deviation of each candidate's fold scores, best RMSE first.
+    '''
+    summary = results.groupby('mode')[['RMSE', 'MAPE', 'epochs']].agg(['mean', 'std'])
+    return summary.sort_values(('RMSE', 'mean'))
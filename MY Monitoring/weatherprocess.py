@@ -2,10 +2,15 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
-from sklearn.metrics import mean_absolute_percentage_error, mean_squared_error
 import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras import layers
+
+from feature_store import HourlyFeatureStore
+from training import lin_model, deep_model, early_stopping, cross_validate, summarise
+
+# ----- PARAMS
+max_epochs = 500 # upper limit, training stops once the validation loss stops improving
+patience = 20 # epochs without validation improvement before stopping
+n_folds = 5 # time-series cross-validation folds
 
 def df_shifted(df, target=None, lag=0):
     '''
@@ -29,71 +34,6 @@ def df_shifted(df, target=None, lag=0):
             new[c] = df[c].shift(periods=lag)
     return pd.DataFrame(data=new)
 
-def lin_model(norm, train_features, loss_func):
-    '''
-    Returns a compiled linear model.
-
-            Parameters:
-                norm (tf.layers.Normalization): Adapted normalization filter
-                train_features (list of str): List of features to train on
-                loss_func (str): Name of the loss function to use
-
-            Returns:
-                model (tf.model): Compiled linear model
-    '''
-    linear_model = tf.keras.Sequential([norm, layers.Dense(units=1)])
-    linear_model.predict(train_features)
-    linear_model.compile(optimizer = tf.optimizers.Adam(learning_rate=0.1), loss=loss_func)
-    return linear_model
-
-def deep_model(norm, train_features, loss_func):
-    '''
-    Returns a compiled deep model.
-
-            Parameters:
-                norm (tf.layers.Normalization): Adapted normalization filter
-                train_features (list of str): List of features to train on
-                loss_func (str): Name of the loss function to use
-
-            Returns:
-                model (tf.model): Compiled deep model
-    '''
-    if len(train_features.columns) > 10:
-        model = tf.keras.Sequential([
-            norm,
-            layers.Dense(64, activation='relu'),
-            layers.BatchNormalization(),
-            layers.Dense(64, activation='relu'),
-            layers.BatchNormalization(),
-            layers.Dense(64, activation='relu'),
-            layers.BatchNormalization(),
-            layers.Dense(64, activation='relu'),
-            layers.BatchNormalization(),
-            layers.Dense(64, activation='relu'),
-            layers.BatchNormalization(),
-            layers.Dense(64, activation='relu'),
-            layers.BatchNormalization(),
-            layers.Dense(64, activation='relu'),
-            layers.BatchNormalization(),
-            layers.Dense(64, activation='relu'),
-            layers.Dense(1)
-            ])
-    else:
-        model = tf.keras.Sequential([
-            norm,
-            layers.Dense(64, activation='relu'),
-            layers.BatchNormalization(),
-            layers.Dense(64, activation='relu'),
-            layers.BatchNormalization(),
-            layers.Dense(64, activation='relu'),
-            layers.BatchNormalization(),
-            layers.Dense(64, activation='relu'),
-            layers.Dense(1)
-            ])
-    model.predict(train_features)
-    model.compile(optimizer = tf.optimizers.Adam(learning_rate=0.0005), loss=loss_func)
-    return model
-
 def regression(df, y_col, mode, loss_func='mean_squared_error'):
     '''
     Returns the test dataset and the RMSE of the model.
@@ -129,9 +69,10 @@ def regression(df, y_col, mode, loss_func='mean_squared_error'):
     history = model.fit(
         train_features,
         train_labels,
-        epochs=200,
+        epochs=max_epochs,
         verbose=0,
-        validation_split = 0.2)
+        validation_split = 0.2,
+        callbacks=[early_stopping(patience)])
 
     # use the model to predict the test features
     test_predictions = model.predict(test_features).flatten()
@@ -145,51 +86,40 @@ def regression(df, y_col, mode, loss_func='mean_squared_error'):
     model.save(mode.lower()+'_model_weather.h5')
     return test_features, np.sqrt(model.evaluate(test_features.drop(columns=['Prediction', 'Reference Value']), test_labels, verbose=0))
 
-# ----- PREPROCESS WEATHER DATA
-weather = pd.read_csv('MY_weatherdata.csv')
-weather['last_updated'] = pd.to_datetime(weather['last_updated'])
-weather.drop_duplicates(subset='last_updated', inplace=True)
-weather.set_index('last_updated', inplace=True)
-weather.sort_index(inplace=True)
-weather = weather.loc['2022-02-09':'2022-04-13']
-weather.drop(columns=['timestamp','last_updated_epoch', 'feelslike_f', 'gust_mph', 'precip_in', 'pressure_in', 'temp_f', 'vis_miles', 'wind_dir', 'wind_mph'], inplace=True)
-# produces 15 columns corresponding to the various conditions
-weather = pd.get_dummies(weather, columns=['condition'])
-weather = weather.resample('1H').pad()
-
-# ----- PROCESS PM DATA
-data = pd.read_csv('results 17 5.csv')
-data['Time'] = pd.to_datetime(data['Time'])
-data.set_index('Time', inplace=True)
-data.sort_index(inplace=True)
-data = data.apply(pd.to_numeric, errors='coerce')
-data = data.resample('1H').mean()
-
-# ----- COMBINING DATAFRAMES
-data = pd.concat([data, weather], axis=1, join='inner')
-
-# ----- MODEL
-learn_results = {}
-
-# construct the learning data based on selected features
-# learn_df = data[['Temperature','Relative Humidity','PM2.5','PM10','1H Reference']]
-learn_df = data[['precip_mm','humidity','temp_c','wind_kph','Temperature','Relative Humidity','PM2.5','PM10','1H Reference']]
-# learn_df = data[list(weather.columns)+['Temperature','Relative Humidity','PM2.5','PM10','1H Reference']]
-
-# augment the learning data with additional columns
-learn_df['Delay'] = learn_df['PM2.5'].shift(periods=1)
-learn_df['Hour'] = learn_df.index.hour
-learn_df['Day'] = learn_df.index.weekday
-learn_df.dropna(inplace=True)
-# learn_df.to_csv('cleaned data + weather.csv')
-
-# train the models and display results
-df_linear, learn_results['linear'] = regression(learn_df, '1H Reference', 'Linear')
-df_deep, learn_results['deep'] = regression(learn_df, '1H Reference', 'Deep')
-# df_deep_no_weather, learn_results['deep_no_weather'] = regression(learn_df[['Temperature','Relative Humidity','PM2.5','PM10','1H Reference']], '1H Reference', 'Deep')
-print(learn_results)
-
-# plot the performance of the selected deep model
-df_deep.reset_index(inplace=True)
-df_deep[['PM2.5', 'Prediction', 'Reference Value']].plot(ylabel='PM2.5, ug/m3', figsize=(18,12), color=['gray','blue','red'])
-plt.savefig('PM_measured_predicted_ref.png', dpi=300)
\ No newline at end of file
+if __name__ == '__main__':
+    # ----- HOURLY WEATHER AND PM DATA
+    # joined hourly dataset, extended with the rows appended to the weather log and PM results since the last run
+    data = HourlyFeatureStore('feature_store', 'MY_weatherdata.csv', 'results 17 5.csv').hourly()
+    data = data.loc['2022-02-09':'2022-04-13']
+
+    # ----- MODEL
+    learn_results = {}
+
+    # construct the learning data based on selected features
+    # learn_df = data[['Temperature','Relative Humidity','PM2.5','PM10','1H Reference']]
+    learn_df = data[['precip_mm','humidity','temp_c','wind_kph','Temperature','Relative Humidity','PM2.5','PM10','1H Reference']]
+    # learn_df = data[list(weather.columns)+['Temperature','Relative Humidity','PM2.5','PM10','1H Reference']]
+
+    # augment the learning data with additional columns
+    learn_df['Delay'] = learn_df['PM2.5'].shift(periods=1)
+    learn_df['Hour'] = learn_df.index.hour
+    learn_df['Day'] = learn_df.index.weekday
+    learn_df.dropna(inplace=True)
+    # learn_df.to_csv('cleaned data + weather.csv')
+
+    # compare the candidates on time-ordered folds, trained in parallel with early stopping
+    cv_results = cross_validate(learn_df, '1H Reference', modes=('linear', 'deep'), n_folds=n_folds, max_epochs=max_epochs, patience=patience)
+    print(cv_results.to_string(index=False))
+    print(summarise(cv_results))
+    cv_results.to_csv('cv_results.csv', index=False)
+
+    # train the models and display results
+    df_linear, learn_results['linear'] = regression(learn_df, '1H Reference', 'Linear')
+    df_deep, learn_results['deep'] = regression(learn_df, '1H Reference', 'Deep')
+    # df_deep_no_weather, learn_results['deep_no_weather'] = regression(learn_df[['Temperature','Relative Humidity','PM2.5','PM10','1H Reference']], '1H Reference', 'Deep')
+    print(learn_results)
+
+    # plot the performance of the selected deep model
+    df_deep.reset_index(inplace=True)
+    df_deep[['PM2.5', 'Prediction', 'Reference Value']].plot(ylabel='PM2.5, ug/m3', figsize=(18,12), color=['gray','blue','red'])
+    plt.savefig('PM_measured_predicted_ref.png', dpi=300)
\ No newline at end of file
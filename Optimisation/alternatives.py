@@ -0,0 +1,230 @@
+import networkx as nx
+
+def shortest_path_tree(G, root, weight, reverse=False):
+    '''
+    Returns a shortest-path tree rooted at a node.
+
+            Parameters:
+                    G (nx.MultiDiGraph): The travel graph
+                    root (int): The node at which the tree is rooted
+                    weight (str or function): Edge attribute or networkx weight function to minimise
+                    reverse (bool): Build the tree on the reversed graph, i.e. towards the root
+
+            Returns:
+                    parent (dict): The next node towards the root for every reached node
+                    dist (dict): The cost between the root and every reached node
+    '''
+    H = G.reverse(copy=False) if reverse else G
+    pred, dist = nx.dijkstra_predecessor_and_distance(H, root, weight=weight)
+    parent = {node: p[0] for node, p in pred.items() if p}
+    return parent, dist
+
+def tree_path(parent, node):
+    '''
+    Returns the node sequence from a node back to the root of its tree.
+
+            Parameters:
+                    parent (dict): Tree returned by shortest_path_tree()
+                    node (int): The node at which to start
+
+            Returns:
+                    path (list of int): Nodes from node to the tree's root
+    '''
+    path = [node]
+    while path[-1] in parent:
+        path.append(parent[path[-1]])
+    return path
+
+def route_edges(route):
+    '''
+    Returns the set of directed edges traversed by a route.
+
+            Parameters:
+                    route (list of int): Node sequence of the route
+
+            Returns:
+                    edges (set of tuple): (u, v) pairs of the route
+    '''
+    return set(zip(route[:-1], route[1:]))
+
+def edge_cost(G, u, v, weight):
+    '''
+    Returns the cost of stepping from u to v, taking the lightest of any parallel edges.
+
+            Parameters:
+                    G (nx.MultiDiGraph): The travel graph
+                    u (int): The first node
+                    v (int): The second node
+                    weight (str or function): Edge attribute or networkx weight function
+
+            Returns:
+                    cost (float): Cost of the step
+    '''
+    if callable(weight):
+        return weight(u, v, G[u][v])
+    return min(d[weight] for d in G[u][v].values())
+
+def route_length(G, route, weight='length'):
+    '''
+    Returns the summed weight of a route, taking the lightest of any parallel edges.
+
+            Parameters:
+                    G (nx.MultiDiGraph): The travel graph
+                    route (list of int): Node sequence of the route
+                    weight (str or function): Edge attribute or networkx weight function to sum
+
+            Returns:
+                    total (float): Summed weight along the route
+    '''
+    return sum(edge_cost(G, u, v, weight) for u, v in zip(route[:-1], route[1:]))
+
+def overlap(G, route, others, length='length'):
+    '''
+    Returns the largest fraction of a route's distance shared with any of the other routes.
+
+            Parameters:
+                    G (nx.MultiDiGraph): The travel graph
+                    route (list of int): Node sequence of the candidate route
+                    others (list of list of int): Previously selected routes
+                    length (str): Edge attribute used to measure distance
+
+            Returns:
+                    overlap (float): Shared distance over candidate distance, 0-1
+    '''
+    total = route_length(G, route, length)
+    if total == 0 or not others:
+        return 0.0
+    shared = 0.0
+    for other in others:
+        common = route_edges(route) & route_edges(other)
+        shared = max(shared, sum(min(d[length] for d in G[u][v].values()) for u, v in common))
+    return shared / total
+
+def plateaus(fwd_parent, bwd_parent, fwd_dist, bwd_dist):
+    '''
+    Returns the plateaus shared by a forward and a backward shortest-path tree.
+
+    A plateau is a maximal chain of edges lying on both trees; every plateau
+    defines a locally-optimal via route through it.
+
+            Parameters:
+                    fwd_parent (dict): Tree from the origin, see shortest_path_tree()
+                    bwd_parent (dict): Tree towards the destination, see shortest_path_tree()
+                    fwd_dist (dict): Costs from the origin
+                    bwd_dist (dict): Costs to the destination
+
+            Returns:
+                    plateaus (list of tuple): (route cost, plateau cost, first node, last node)
+    '''
+    # every node has at most one plateau edge in (its forward parent) and one out (its backward parent)
+    nxt = {}
+    for v, u in fwd_parent.items():
+        if bwd_parent.get(u) == v:
+            nxt[u] = v
+    starts = set(nxt) - set(nxt.values())
+
+    found = []
+    for first in starts:
+        last = first
+        while last in nxt:
+            last = nxt[last]
+        cost = fwd_dist[first] + bwd_dist[first]
+        plateau_cost = fwd_dist[last] - fwd_dist[first]
+        found.append((cost, plateau_cost, first, last))
+    return found
+
+def alternative_routes(G, orig, dest, weight, k=3, max_stretch=0.25, max_overlap=0.5, length='length'):
+    '''
+    Returns up to k meaningfully different low-cost routes using the plateau method.
+
+    Both shortest-path trees are built once and every alternative is read off
+    them, so no further searches are required after the first two.
+
+            Parameters:
+                    G (nx.MultiDiGraph): The travel graph
+                    orig (int): The origin node
+                    dest (int): The destination node
+                    weight (str or function): Edge attribute or networkx weight function to minimise, e.g. 'rdd_a'
+                    k (int): Maximum number of routes to return, including the optimum
+                    max_stretch (float): Maximum extra cost of an alternative relative to the optimum
+                    max_overlap (float): Maximum fraction of an alternative's distance shared with any selected route
+                    length (str): Edge attribute used to measure overlap
+
+            Returns:
+                    routes (list of list of int): Node sequences, cheapest first, or [] if unreachable
+    '''
+    fwd_parent, fwd_dist = shortest_path_tree(G, orig, weight)
+    if dest not in fwd_dist:
+        return []
+    bwd_parent, bwd_dist = shortest_path_tree(G, dest, weight, reverse=True)
+
+    optimum = tree_path(fwd_parent, dest)[::-1]
+    routes = [optimum]
+    costs = [fwd_dist[dest]]
+    bound = fwd_dist[dest] * (1 + max_stretch)
+
+    candidates = plateaus(fwd_parent, bwd_parent, fwd_dist, bwd_dist)
+
+    # prefer long plateaus, they give routes which are locally optimal over the largest span
+    candidates = [p for p in candidates if p[0] <= bound]
+    candidates.sort(key=lambda p: p[0] - p[1])
+
+    for cost, _, first, last in candidates:
+        if len(routes) == k:
+            break
+        head = tree_path(fwd_parent, first)[::-1]
+        tail = tree_path(bwd_parent, first)
+        route = head[:-1] + tail
+        if len(set(route)) != len(route) or route in routes:
+            continue
+        if overlap(G, route, routes, length) > max_overlap:
+            continue
+        routes.append(route)
+        costs.append(cost)
+    return [route for _, route in sorted(zip(costs, routes), key=lambda r: r[0])]
+
+def penalty_routes(G, orig, dest, weight, k=3, penalty=0.5, max_stretch=0.25, max_overlap=0.5, length='length'):
+    '''
+    Returns up to k alternative routes using the penalty method.
+
+    Slower than alternative_routes() as every iteration runs a full search, but
+    it finds alternatives where the two trees share few plateaus.
+
+            Parameters:
+                    G (nx.MultiDiGraph): The travel graph
+                    orig (int): The origin node
+                    dest (int): The destination node
+                    weight (str or function): Edge attribute or networkx weight function to minimise, e.g. 'rdd_a'
+                    k (int): Maximum number of routes to return, including the optimum
+                    penalty (float): Fractional cost increase applied to edges of previously found routes
+                    max_stretch (float): Maximum extra cost of an alternative relative to the optimum
+                    max_overlap (float): Maximum fraction of an alternative's distance shared with any selected route
+                    length (str): Edge attribute used to measure overlap
+
+            Returns:
+                    routes (list of list of int): Node sequences, cheapest first, or [] if unreachable
+    '''
+    factor = {}
+    def penalised(u, v, d):
+        return edge_cost(G, u, v, weight) * factor.get((u, v), 1.0)
+
+    try:
+        optimum = nx.dijkstra_path(G, orig, dest, weight=weight)
+    except nx.NetworkXNoPath:
+        return []
+    routes = [optimum]
+    bound = route_length(G, optimum, weight) * (1 + max_stretch)
+
+    route = optimum
+    for _ in range(4 * k):
+        if len(routes) == k:
+            break
+        for edge in route_edges(route):
+            factor[edge] = factor.get(edge, 1.0) * (1 + penalty)
+        route = nx.dijkstra_path(G, orig, dest, weight=penalised)
+        if route in routes or route_length(G, route, weight) > bound:
+            continue
+        if overlap(G, route, routes, length) > max_overlap:
+            continue
+        routes.append(route)
+    return sorted(routes, key=lambda r: route_length(G, r, weight))
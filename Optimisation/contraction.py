@@ -0,0 +1,245 @@
+import heapq
+from time import perf_counter
+
+import numpy as np
+
+# ----- PARAMS
+graph_file = '../Mapping/data/London.graphml'
+n_pairs = 200 # random O-D pairs used to verify and time the contracted graph
+ambient_pm = 10 # ug/m3
+subject = {'hr_0': 60, 'm': 90, 'Tr': 22, 'hr_max': 180, 'c': 0.15, 'kf': 1e-5, 'sex': 'M', 'v': 15}
+
+def chains(u, v, keep=()):
+    '''
+    Returns the edge chains of a graph running between nodes which are not degree-2 pass-through nodes.
+
+    A node is passed through if it has a single in-edge and a single out-edge to two
+    different neighbours (one-way street), or an in-edge and an out-edge to each of
+    two different neighbours (two-way street).
+
+            Parameters:
+                    u (np.ndarray): Source node of every edge
+                    v (np.ndarray): Target node of every edge
+                    keep (collection of int): Nodes never to be contracted
+
+            Returns:
+                    chains (list of list of int): Edge ids of every chain, in travel order
+    '''
+    out_edges, in_edges = {}, {}
+    for e, (a, b) in enumerate(zip(u.tolist(), v.tolist())):
+        out_edges.setdefault(a, []).append(e)
+        in_edges.setdefault(b, []).append(e)
+
+    passed = set()
+    for n in set(out_edges) & set(in_edges):
+        if n in keep:
+            continue
+        ins, outs = in_edges[n], out_edges[n]
+        sources = set(u[ins].tolist())
+        targets = set(v[outs].tolist())
+        if n in sources or n in targets:
+            continue
+        if len(ins) == 1 and len(outs) == 1 and sources != targets:
+            passed.add(n)
+        elif len(ins) == 2 and len(outs) == 2 and len(sources) == 2 and sources == targets:
+            passed.add(n)
+
+    def walk(e):
+        chain = [e]
+        prev, cur = u[e], v[e]
+        while cur in passed:
+            e = next(o for o in out_edges[cur] if v[o] != prev or len(out_edges[cur]) == 1)
+            chain.append(e)
+            prev, cur = cur, v[e]
+        return chain
+
+    found = []
+    covered = np.zeros(len(u), dtype=bool)
+    for n in out_edges:
+        if n not in passed:
+            for e in out_edges[n]:
+                chain = walk(e)
+                covered[chain] = True
+                found.append(chain)
+
+    # rings made only of pass-through nodes are kept by retaining one of their nodes
+    for e in np.flatnonzero(~covered).tolist():
+        if covered[e]:
+            continue
+        passed.discard(u[e])
+        for o in out_edges[u[e]]:
+            chain = walk(o)
+            covered[chain] = True
+            found.append(chain)
+    return found
+
+class ContractedGraph:
+    '''
+    A travel graph with its degree-2 chains collapsed into super-edges of summed weight.
+
+    The unpacking table holds every super-edge's original edge ids, so routes expand
+    back to the original node sequence. Queries may start or end on contracted nodes.
+    '''
+    def __init__(self, store, columns, keep=()):
+        '''
+                Parameters:
+                        store (WeightStore): Weight store of the travel graph
+                        columns (list of str): Weight store columns to route on, e.g. ['rdd_a']
+                        keep (collection of int): Nodes never to be contracted
+        '''
+        self.store = store
+        found = chains(store.u, store.v, keep)
+        lengths = np.array([len(c) for c in found], dtype=np.int64)
+
+        # unpacking table: super-edge s expands to eids[offsets[s]:offsets[s+1]]
+        self.eids = np.fromiter((e for c in found for e in c), dtype=np.int64, count=lengths.sum())
+        self.offsets = np.zeros(len(found) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(lengths)
+        self.su = store.u[self.eids[self.offsets[:-1]]]
+        self.sv = store.v[self.eids[self.offsets[1:] - 1]]
+
+        # cumulative weights along every chain locate contracted nodes part-way along a super-edge
+        self.cum = {}
+        self.weights = {}
+        for c in columns:
+            w = store[c][self.eids].astype(np.float64)
+            self.weights[c] = np.add.reduceat(w, self.offsets[:-1]) if len(w) else w
+            cum = np.cumsum(w)
+            self.cum[c] = cum - np.repeat(np.concatenate([[0.0], cum[self.offsets[1:-1] - 1]]), lengths)
+
+        self.interior = {}
+        for s, (start, end) in enumerate(zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())):
+            for pos in range(start, end - 1):
+                self.interior.setdefault(int(store.v[self.eids[pos]]), []).append((s, pos))
+
+        self.adj = {}
+        for s, a in enumerate(self.su.tolist()):
+            self.adj.setdefault(a, []).append(s)
+        self.sv_list = self.sv.tolist()
+
+    def __len__(self):
+        return len(self.su)
+
+    def route(self, orig, dest, column):
+        '''
+        Returns the lowest-cost route between two nodes of the original graph.
+
+                Parameters:
+                        orig (int): The origin node
+                        dest (int): The destination node
+                        column (str): Column to minimise, e.g. 'rdd_a'
+
+                Returns:
+                        route (list of int): Original node sequence of the route, None if unreachable
+                        eids (np.ndarray): WeightStore edge id of every step, None if unreachable
+        '''
+        if orig == dest:
+            return [orig], np.empty(0, dtype=np.int64)
+        weights, cum = self.weights[column], self.cum[column]
+
+        # seeds: (node reached, cost, flat positions of the leading partial chain)
+        if orig in self.interior:
+            seeds = [(self.sv_list[s], weights[s] - cum[pos], (pos + 1, self.offsets[s+1])) for s, pos in self.interior[orig]]
+        else:
+            seeds = [(orig, 0.0, (0, 0))]
+        # targets: node -> list of (extra cost, flat positions of the trailing partial chain)
+        if dest in self.interior:
+            targets = {}
+            for s, pos in self.interior[dest]:
+                targets.setdefault(int(self.su[s]), []).append((cum[pos], (self.offsets[s], pos + 1)))
+        else:
+            targets = {dest: [(0.0, (0, 0))]}
+
+        best, best_end = np.inf, None
+        # both ends part-way along the same super-edge, in order
+        if orig in self.interior and dest in self.interior:
+            for so, po in self.interior[orig]:
+                for sd, pd in self.interior[dest]:
+                    if so == sd and pd > po and cum[pd] - cum[po] < best:
+                        best, best_end = cum[pd] - cum[po], ('direct', (po + 1, pd + 1))
+
+        dist, pred, heap = {}, {}, []
+        for node, cost, lead in seeds:
+            if cost < dist.get(node, np.inf):
+                dist[node] = cost
+                pred[node] = ('seed', lead)
+                heapq.heappush(heap, (cost, node))
+
+        done = set()
+        while heap:
+            d, a = heapq.heappop(heap)
+            if d >= best:
+                break
+            if a in done:
+                continue
+            done.add(a)
+            for extra, trail in targets.get(a, ()):
+                if d + extra < best:
+                    best, best_end = d + extra, (a, trail)
+            for s in self.adj.get(a, ()):
+                b = self.sv_list[s]
+                nd = d + weights[s]
+                if nd < dist.get(b, np.inf):
+                    dist[b] = nd
+                    pred[b] = s
+                    heapq.heappush(heap, (nd, b))
+
+        if best_end is None:
+            return None, None
+        if best_end[0] == 'direct':
+            eids = self.eids[best_end[1][0]:best_end[1][1]]
+        else:
+            node, (start, end) = best_end
+            pieces = [self.eids[start:end]]
+            while not isinstance(pred[node], tuple):
+                s = pred[node]
+                pieces.append(self.eids[self.offsets[s]:self.offsets[s+1]])
+                node = int(self.su[s])
+            start, end = pred[node][1]
+            pieces.append(self.eids[start:end])
+            eids = np.concatenate(pieces[::-1])
+        return [orig] + self.store.v[eids].tolist(), eids
+
+if __name__ == '__main__':
+    import osmnx as ox
+    import networkx as nx
+    from weight_store import WeightStore
+
+    G = ox.load_graphml(graph_file)
+    store = WeightStore(G)
+    store.add_profile('a', subject, ambient_pm)
+
+    t0 = perf_counter()
+    contracted = ContractedGraph(store, ['rdd_a'])
+    print(f"Contracted {len(store)} edges to {len(contracted)} super-edges in {perf_counter()-t0:.2f} s")
+    full = ContractedGraph(store, ['rdd_a'], keep=set(G.nodes))
+
+    nodes = list(G)
+    timings = {'contracted': [], 'full': [], 'networkx': []}
+    identical, costs_equal, reached = 0, 0, 0
+    for _ in range(n_pairs):
+        orig, dest = (nodes[i] for i in np.random.choice(len(nodes), 2, replace=False))
+        for name, graph in [('contracted', contracted), ('full', full)]:
+            t0 = perf_counter()
+            route, eids = graph.route(orig, dest, 'rdd_a')
+            timings[name].append(perf_counter()-t0)
+            if name == 'contracted':
+                c_route, c_eids = route, eids
+        t0 = perf_counter()
+        try:
+            reference = nx.dijkstra_path(G, orig, dest, weight=store.weight('rdd_a'))
+        except nx.NetworkXNoPath:
+            reference = None
+        timings['networkx'].append(perf_counter()-t0)
+
+        if reference is None:
+            identical += c_route is None
+            continue
+        reached += 1
+        identical += c_route == reference
+        costs_equal += np.isclose(store['rdd_a'][c_eids].sum(dtype=float), store['rdd_a'][eids].sum(dtype=float), rtol=1e-9)
+
+    print(f"{identical}/{n_pairs} routes identical to networkx, {costs_equal}/{reached} costs equal to the uncontracted search")
+    for name, t in timings.items():
+        print(f"{name}:\t{np.mean(t)*1000:.2f} ms mean\t{np.percentile(t, 95)*1000:.2f} ms p95")
+    print(f"Speedup over the uncontracted search: {np.mean(timings['full'])/np.mean(timings['contracted']):.2f}x")
@@ -6,6 +6,8 @@ import sys
 
 # sys.path.append('../Optimisation/')
 from rdd import *
+sys.path.append('../Commute Monitoring/')
+from trip_store import TripStore
 
 # BIKE PARAMS
 g = 9.81
@@ -175,45 +177,45 @@ log = log.assign(rdd = 0.0)
 for subject in subjects.keys():
     print(subject)
     directory = os.path.join('../Commute Monitoring/'+subject+'/Calibrated/')
-    for root,dirs,files in os.walk(directory):
-        for file in files:
-            if file.endswith(".csv"):
-                raw_data = pd.read_csv(directory+file)
-                raw_data['WriteTime'] = pd.to_datetime(raw_data['WriteTime'])
-
-                dists = []
-                for x in range(len(raw_data)-1):
-                    dists.append(gps_dist(raw_data.iloc[x], raw_data.iloc[x+1]))
-
-                df = raw_data[['WriteTime', 'Alt']].diff()
-                df['PM2.5'] = raw_data['Calibrated PM2.5'].shift(1)
-
-                df = df.dropna().reset_index(drop=True)
-                df = pd.concat([df, pd.Series(dists)], axis=1, ignore_index=True)
-                df.rename(columns={0: 'dt', 1: 'dh', 2: 'PM2.5', 3: 'distance'}, inplace=True)
-                df = df.loc[~(df==0).all(axis=1)]
-
-                df['dt'] = df['dt'].dt.total_seconds()
-
-                df['velocity'] = df.apply(calc_velocity, axis=1)
-
-                df['power'] = df.apply(row_power, args=(subjects[subject],), axis=1)
-                df['power_history'] = df['power'].rolling(20).sum()
-                df['power_history'].fillna(df['power'].shift(1), inplace=True)
-                df['power_history'].fillna(0.0, inplace=True)
-                df.dropna(inplace=True)
-                                                
-                df['rdd'] = df.apply(row_pm, args=(subjects[subject],), axis=1)
-                print(f"\t{file[:-4]}\t{sum(df['rdd']):.2f} ug")
-
-                df['power_history'] = 0.0
-                df['rdd_nohis'] = df.apply(row_pm, args=(subjects[subject],), axis=1)
-                print(f"\t...\t{sum(df['rdd_nohis']):.2f} ug")
-                diff = (sum(df['rdd_nohis']) - sum(df['rdd'])) / sum(df['rdd'])
-                print(f"\t...\t{diff*100:.5f}% difference")
-
-                idx = log[log['file']==file].index
-                log.loc[idx, 'rdd'] = sum(df['rdd'])
+    calibrated = TripStore(directory)
+    calibrated.import_csv(directory) # commutes calibrated to CSV before the trip store existed
+    for name in calibrated.names:
+        file = name+'.csv'
+        raw_data = calibrated.read(name, columns=['Alt', 'Lat', 'Lng', 'Calibrated PM2.5']).reset_index()
+
+        dists = []
+        for x in range(len(raw_data)-1):
+            dists.append(gps_dist(raw_data.iloc[x], raw_data.iloc[x+1]))
+
+        df = raw_data[['WriteTime', 'Alt']].diff()
+        df['PM2.5'] = raw_data['Calibrated PM2.5'].shift(1)
+
+        df = df.dropna().reset_index(drop=True)
+        df = pd.concat([df, pd.Series(dists)], axis=1, ignore_index=True)
+        df.rename(columns={0: 'dt', 1: 'dh', 2: 'PM2.5', 3: 'distance'}, inplace=True)
+        df = df.loc[~(df==0).all(axis=1)]
+
+        df['dt'] = df['dt'].dt.total_seconds()
+
+        df['velocity'] = df.apply(calc_velocity, axis=1)
+
+        df['power'] = df.apply(row_power, args=(subjects[subject],), axis=1)
+        df['power_history'] = df['power'].rolling(20).sum()
+        df['power_history'].fillna(df['power'].shift(1), inplace=True)
+        df['power_history'].fillna(0.0, inplace=True)
+        df.dropna(inplace=True)
+                                        
+        df['rdd'] = df.apply(row_pm, args=(subjects[subject],), axis=1)
+        print(f"\t{file[:-4]}\t{sum(df['rdd']):.2f} ug")
+
+        df['power_history'] = 0.0
+        df['rdd_nohis'] = df.apply(row_pm, args=(subjects[subject],), axis=1)
+        print(f"\t...\t{sum(df['rdd_nohis']):.2f} ug")
+        diff = (sum(df['rdd_nohis']) - sum(df['rdd'])) / sum(df['rdd'])
+        print(f"\t...\t{diff*100:.5f}% difference")
+
+        idx = log[log['file']==file].index
+        log.loc[idx, 'rdd'] = sum(df['rdd'])
 
 # display and save the updated log file
 print(log.sort_values(by=['rdd']))
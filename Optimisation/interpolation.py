@@ -0,0 +1,115 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+def edge_midpoints(edges, crs=27700):
+    '''
+    Returns the midpoint of every edge in a projected CRS.
+
+            Parameters:
+                    edges (gpd.GeoDataFrame): Edges of the travel graph
+                    crs (int): EPSG code of the projected CRS, British National Grid by default
+
+            Returns:
+                    midpoints (np.ndarray): (edges, 2) x/y coordinates, m
+    '''
+    mid = edges.geometry.to_crs(epsg=crs).interpolate(0.5, normalized=True)
+    return np.column_stack([mid.x.values, mid.y.values])
+
+class EdgeInterpolator:
+    '''
+    Fills unmeasured edges with the inverse-distance weighted PM2.5 of the k nearest measured edges.
+
+    Neighbours are weighted by measurement count over distance to the power p. The
+    neighbour table is kept between calls, so updated aggregates only requery the
+    edges near newly measured ones.
+    '''
+    def __init__(self, midpoints, k=8, power=2, chunk=100000):
+        '''
+                Parameters:
+                        midpoints (np.ndarray): (edges, 2) projected edge midpoints, m
+                        k (int): Number of measured neighbours used for every edge
+                        power (float): Inverse-distance power
+                        chunk (int): Edges queried and weighted at a time
+        '''
+        self.midpoints = midpoints
+        self.k = k
+        self.power = power
+        self.chunk = chunk
+        self.measured = np.zeros(len(midpoints), dtype=bool)
+        self.neighbours = None # (targets, k) edge ids of the nearest measured edges
+        self.distances = None
+
+    def query(self, targets):
+        '''
+        Returns the nearest measured edges and their distances for the given edges, queried in chunks.
+        '''
+        ids = np.flatnonzero(self.measured)
+        k = min(self.k, len(ids))
+        nbrs = np.empty((len(targets), k), dtype=np.int64)
+        dists = np.empty((len(targets), k))
+        for start in range(0, len(targets), self.chunk):
+            d, i = self.tree.query(self.midpoints[targets[start:start+self.chunk]], k=k)
+            d, i = d.reshape(len(d), k), i.reshape(len(i), k)
+            nbrs[start:start+self.chunk] = ids[i]
+            dists[start:start+self.chunk] = d
+        return nbrs, dists
+
+    def fit(self, values, counts):
+        '''
+        Returns PM2.5 on every edge, rebuilding the neighbour table from scratch.
+
+                Parameters:
+                        values (np.ndarray): Mean PM2.5 of every edge, NaN where unmeasured, ug/m3
+                        counts (np.ndarray): Number of commutes measured on every edge
+
+                Returns:
+                        pm (np.ndarray): Measured or interpolated PM2.5 of every edge, ug/m3
+        '''
+        self.measured = ~np.isnan(values) & (counts > 0)
+        if not self.measured.any():
+            return np.full(len(values), np.nan)
+        self.tree = cKDTree(self.midpoints[self.measured])
+        self.targets = np.flatnonzero(~self.measured)
+        self.neighbours, self.distances = self.query(self.targets)
+        return self.weigh(values, counts)
+
+    def update(self, values, counts):
+        '''
+        Returns PM2.5 on every edge after the aggregate has changed, requerying only edges near new measurements.
+
+                Parameters:
+                        values (np.ndarray): Mean PM2.5 of every edge, NaN where unmeasured, ug/m3
+                        counts (np.ndarray): Number of commutes measured on every edge
+
+                Returns:
+                        pm (np.ndarray): Measured or interpolated PM2.5 of every edge, ug/m3
+        '''
+        measured = ~np.isnan(values) & (counts > 0)
+        if self.neighbours is None or (self.measured & ~measured).any() or self.neighbours.shape[1] < min(self.k, measured.sum()):
+            return self.fit(values, counts)
+
+        new = np.flatnonzero(measured & ~self.measured)
+        if len(new):
+            self.measured = measured
+            self.tree = cKDTree(self.midpoints[measured])
+            keep = ~measured[self.targets]
+            self.targets, self.neighbours, self.distances = self.targets[keep], self.neighbours[keep], self.distances[keep]
+
+            # only edges with a new measurement closer than their furthest neighbour can change
+            d_new, _ = cKDTree(self.midpoints[new]).query(self.midpoints[self.targets])
+            changed = np.flatnonzero(d_new < self.distances[:, -1])
+            if len(changed):
+                self.neighbours[changed], self.distances[changed] = self.query(self.targets[changed])
+        return self.weigh(values, counts)
+
+    def weigh(self, values, counts):
+        '''
+        Returns the measured values with every unmeasured edge set to its weighted neighbour mean.
+        '''
+        pm = np.where(self.measured, values, np.nan)
+        for start in range(0, len(self.targets), self.chunk):
+            nbrs = self.neighbours[start:start+self.chunk]
+            d = self.distances[start:start+self.chunk]
+            w = counts[nbrs] / np.maximum(d, 1.0)**self.power
+            pm[self.targets[start:start+self.chunk]] = (w * values[nbrs]).sum(axis=1) / w.sum(axis=1)
+        return pm
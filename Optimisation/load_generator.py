@@ -0,0 +1,89 @@
+import asyncio
+import json
+import random
+from time import perf_counter
+
+import numpy as np
+
+# ----- PARAMS
+host = '127.0.0.1'
+port = 8765
+concurrency = 32 # simultaneous client connections
+n_requests = 2000
+repeat_frac = 0.3 # fraction of queries repeating an earlier O-D pair, exercising the cache
+bbox = {'north': 51.56, 'south': 51.44, 'east': -0.05, 'west': -0.27} # London, lat/lng
+profiles = [{'hr_0': 60, 'm': 90, 'Tr': 22, 'hr_max': 180, 'c': 0.15, 'kf': 1e-5, 'sex': 'M', 'v': 15},
+            {'hr_0': 60, 'm': 90, 'Tr': 22, 'hr_max': 180, 'c': 0.15, 'kf': 1e-5, 'sex': 'M', 'v': 25},
+            {'hr_0': 100, 'm': 100, 'Tr': 30, 'hr_max': 180, 'c': 0.45, 'kf': 6e-5, 'sex': 'M', 'v': 15}]
+
+def random_point():
+    '''
+    Returns a random (lat, lng) point within the bounding box.
+    '''
+    return (random.uniform(bbox['south'], bbox['north']), random.uniform(bbox['west'], bbox['east']))
+
+def make_queries(n):
+    '''
+    Returns a list of n route queries, some of which repeat earlier ones.
+
+            Parameters:
+                    n (int): The number of queries
+
+            Returns:
+                    queries (list of dict): Request bodies for POST /route
+    '''
+    queries = []
+    for _ in range(n):
+        if queries and random.random() < repeat_frac:
+            queries.append(random.choice(queries))
+        else:
+            queries.append({'origin': random_point(), 'destination': random_point(), 'subject': random.choice(profiles)})
+    return queries
+
+async def post(reader, writer, body):
+    '''
+    Returns the status code of a POST /route request on an open keep-alive connection.
+    '''
+    payload = json.dumps(body).encode()
+    writer.write(f"POST /route HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload)
+    await writer.drain()
+    status = int((await reader.readline()).decode().split(' ')[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, value = line.decode().split(':', 1)
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+async def client(queue, latencies, statuses):
+    '''
+    Sends queued queries one at a time over a single connection, recording their latency.
+    '''
+    reader, writer = await asyncio.open_connection(host, port)
+    while not queue.empty():
+        body = queue.get_nowait()
+        t0 = perf_counter()
+        statuses.append(await post(reader, writer, body))
+        latencies.append(perf_counter() - t0)
+    writer.close()
+
+async def main():
+    queue = asyncio.Queue()
+    for q in make_queries(n_requests):
+        queue.put_nowait(q)
+
+    latencies, statuses = [], []
+    t0 = perf_counter()
+    await asyncio.gather(*[client(queue, latencies, statuses) for _ in range(concurrency)])
+    elapsed = perf_counter() - t0
+
+    latencies = np.array(latencies) * 1000
+    print(f"{len(latencies)} requests over {concurrency} connections in {elapsed:.2f} s ({len(latencies)/elapsed:.1f} req/s)")
+    print(f"{statuses.count(200)} routed, {len(statuses) - statuses.count(200)} failed")
+    print(f"Latency: p50 {np.percentile(latencies, 50):.1f} ms\tp90 {np.percentile(latencies, 90):.1f} ms\tp99 {np.percentile(latencies, 99):.1f} ms\tmax {latencies.max():.1f} ms")
+
+asyncio.run(main())
@@ -1,18 +1,17 @@
 import numpy as np
-import math
 import pandas as pd
 import matplotlib.pyplot as plt
 
 import osmnx as ox
 import networkx as nx
-from pyproj import CRS
-from shapely.strtree import STRtree
-from shapely.geometry import Point
 
 from time import perf_counter
-from scipy.stats import ttest_ind
 
-from rdd import *
+from weight_store import WeightStore
+from contraction import ContractedGraph
+from rendering import EdgeSegments, BaseMap, Renderer
+from alternatives import alternative_routes, penalty_routes, overlap
+from sequential import SequentialTest
 
 import warnings
 warnings.filterwarnings("ignore")
@@ -20,120 +19,26 @@ warnings.filterwarnings("ignore")
 # set process mode
 mode = "stats"
 
-# import and pre-process travel graph
-G = ox.load_graphml('../Mapping/data/London.graphml')
-nodes, edges = ox.graph_to_gdfs(G)
-projection = CRS.from_epsg(3067)
-nodes = nodes.to_crs(projection)
-edges = edges.to_crs(projection)
-# print(f"London travel graph has {len(edges)} edges connecting {len(nodes)} nodes.")
-
-# BIKE PARAMS
-g = 9.81
-Cd = 0.7
-A = 0.5
-Cr = 0.001
-ro = 1.225
-n_mech = 0.97
-n_elec = 0.72
-
-def segment_power(v, d_height, l):
+def random_od_pair(G):
     '''
-    Returns the power required to traverse a given road segment.
+    Returns a random origin-destination pair of distinct nodes.
 
             Parameters:
-                    v (float): The travel velocity, m/s
-                    d_height (float): The change of height over the road segment, m
-                    l (float): The length of the road segment, m
+                    G (nx.MultiDiGraph): The travel graph
 
             Returns:
-                    power (float): Total required power to traverse the segment, W
+                    orig (int): The origin node
+                    dest (int): The destination node
     '''
-    P_g = g * m * d_height/l * v
-    P_a = 0.5 * Cd * ro * A * v**3
-    P_f = Cr * m * g * v
-    return max(P_g + P_a + P_f, 0) # avoid flooring effects with downhill slopes
-
-def kph_to_mps(kmh):
-    '''
-    Returns the velocity in m/s.
-
-            Parameters:
-                    v (float): The travel velocity, km/h
-
-            Returns:
-                    v (float): The travel velocity, m/s
-    '''
-    return kmh/3600 * 1000
-
-def hr_ss(hr_0, power, t, c):
-    '''
-    Returns the individual's heart rate at the end of the road segment.
-
-            Parameters:
-                    hr_0 (float): The heart rate at the start of the segment, bpm
-                    power (float): The power exerted, W
-                    t (float): The length of the road segment, seconds
-                    c (float): Rise parameter for HR with power, bpm/W
-
-            Returns:
-                    hr (float): Estimated HR at the end of the road segment, bpm
-    '''
-
-    hr_ss = hr_0 + c*power
-    if hr_ss > hr_max:
-        return hr_max
-
-    hr = hr_ss + (hr_0 - hr_ss) * pow(math.e, -t)
-    if hr < hr_ss:
-        return hr
-
-    return hr_ss
-
-def segment_hr(cyclist_power, hr_0, c, t=10, power_history=[]):
-    '''
-    Returns the HR at the end of a road segment.
-
-            Parameters:
-                    cyclist_power (float): The power required to traverse the segment, W
-                    hr_0 (float): The heart rate at the beginning of the segment, bpm
-                    c (float): Rise parameter for HR with power, bpm/W
-                    t (float): The length of the road segment, seconds
-                    power_history (list of floats): A list of any previous segments' power outputs
-
-            Returns:
-                    hr (float): Estimated HR at the end of the road segment, bpm
-    '''
-
-    percieved_power = cyclist_power + kf * sum(power_history)
-    return hr_ss(hr_0, percieved_power, t, c)
-
-def segment_pm(v, d_height, l, hr_0, Tr, c, sex, ambient_pm, power_history=[]):
-    '''
-    Returns the RDD experienced the road segment. Wrapper for rdd.py/calc_rdd()
-
-            Parameters:
-                    v (float): The travel velocity, m/s
-                    d_height (float): The change of height over the road segment, m
-                    l (float): The length of the road segment, m
-                    hr_0 (float): The heart rate at the beginning of the segment, bpm
-                    Tr (float): The rise time of the individual's HR with step change in power, s
-                    c (float): Rise parameter for HR with power, bpm/W
-                    sex (float): Individual's sex 'M' or 'F'
-                    ambient_pm (float): The concentration of PM2.5 on the segment, ug/m3
-                    power_history (list of floats): A list of any previous segments' power outputs
-
-
-            Returns:
-                    RDD (float): Recieved deposition dose over the period of interest, ug
-    '''
-
-    cyclist_power = segment_power(v, d_height, l) / n_mech
-    hr = segment_hr(cyclist_power, hr_0, c, (v/l)/Tr, power_history)
-    return calc_rdd(sex, hr, l/v, ambient_pm)
-
+    orig = list(G)[np.random.randint(len(list(G)))]
+    dest = orig
+    while dest == orig:
+        dest = list(G)[np.random.randint(len(list(G)))]
+    return orig, dest
 
 ambient_pm = 10 # ug/m3
+# per-edge PM2.5 measured and interpolated by the commute monitoring study, see calibrate_records.py
+# ambient_pm = np.load('../Commute Monitoring/edge_pm.npy').astype(float)
 # SUBJECT
 # subjects = {'a': {'hr_0': 60, 'm': 90, 'Tr': 22, 'hr_max': 180, 'c': 0.15, 'kf': 1e-5, 'sex': 'M', 'v': 20, 'color': 'g'},
 #             'b': {'hr_0': 100, 'm': 100, 'Tr': 30, 'hr_max': 180, 'c': 0.45, 'kf': 6e-5, 'sex': 'M', 'v': 20, 'color': 'b'}}
@@ -147,122 +52,169 @@ subjects = {'a_slow': {'hr_0': 60, 'm': 90, 'Tr': 22, 'hr_max': 180, 'c': 0.15,
 #             'b': {'hr_0': 100, 'm': 100, 'Tr': 30, 'hr_max': 180, 'c': 0.45, 'kf': 6e-5, 'sex': 'M', 'v': 15, 'color': 'b'},
 #             'c': {'hr_0': 60, 'm': 90, 'Tr': 22, 'hr_max': 180, 'c': 0.15, 'kf': 1e-5, 'sex': 'M', 'v': 25, 'color': 'r'}}
 
-t0 = perf_counter()
-# iterate through every node to calculate the weights for each subject
-for source, sink, _, data in G.edges(keys=True, data=True):
-    d_height = nodes.loc[sink]['elevation'] - nodes.loc[source]['elevation']
+# rendering processes are spawned and import this script, so only the definitions above run in them
+if __name__ == '__main__':
+    # import the travel graph, elevations and lengths are read into the weight store below
+    G = ox.load_graphml('../Mapping/data/London.graphml')
+    # print(f"London travel graph has {len(G.edges)} edges connecting {len(G.nodes)} nodes.")
+
+    t0 = perf_counter()
+    # calculate the weights of every edge for each subject as columns of the weight store
+    store = WeightStore(G)
     for subject in subjects.keys():
-        m = subjects[subject]['m']
-        Tr = subjects[subject]['Tr']
-        hr_0 = subjects[subject]['hr_0']
-        hr_max = subjects[subject]['hr_max']
-        c = subjects[subject]['c']
-        kf = subjects[subject]['kf']
-        sex = subjects[subject]['sex']
-        v = subjects[subject]['v']
-
-        data['energy_'+subject] = segment_power(kph_to_mps(v), d_height, data['length']) * (data['length'] / kph_to_mps(v))
-        data['rdd_'+subject] = segment_pm(kph_to_mps(v), d_height, data['length'], hr_0, Tr, c, sex, ambient_pm, [])
-
-        data['speed_kph_'+subject] = v
-        distance_km = data['length'] / 1000
-        speed_km_sec = data['speed_kph_'+subject] / (60 * 60)
-        data['travel_time_'+subject] = distance_km / speed_km_sec
-print(f"Time elapsed to calculate graph weights:\t{perf_counter()-t0} s")
-
-# save graph weights
-# ox.save_graphml(G, '../Mapping/data/London_pm.graphml')
-
-# randomly generate and plot ten routes for each subject
-if mode == "random":
-    for j in range(10):
-        print(f"JOURNEY {j}:")
-        if j == -1:
-            G2 = ox.project_graph(G, to_crs='4326') 
-            orig = ox.get_nearest_node(G2, (51.51789, -0.08308), return_dist=False)
-            dest = ox.get_nearest_node(G2, (51.499824,-0.174377), return_dist=False)
+        store.add_profile(subject, subjects[subject], ambient_pm)
+    print(f"Time elapsed to calculate graph weights:\t{perf_counter()-t0} s")
+    print(f"Weight store holds {len(store.columns)} columns in {store.nbytes()/1e6:.1f} MB")
+
+    # save graph weights
+    # store.to_graphml('../Mapping/data/London_pm.graphml')
+
+    # randomly generate and plot ten routes for each subject
+    if mode == "random":
+        segments = EdgeSegments.from_graph(G)
+        renderer = Renderer(BaseMap(segments, figsize=(24,16), dpi=300, color='#999999', linewidth=1))
+        for j in range(10):
+            print(f"JOURNEY {j}:")
+            if j == -1:
+                G2 = ox.project_graph(G, to_crs='4326') 
+                orig = ox.get_nearest_node(G2, (51.51789, -0.08308), return_dist=False)
+                dest = ox.get_nearest_node(G2, (51.499824,-0.174377), return_dist=False)
         
-        else:
-            orig = list(G)[np.random.randint(len(list(G)))]
-            dest = orig
-            while dest == orig:
-                dest = list(G)[np.random.randint(len(list(G)))]
+            else:
+                orig, dest = random_od_pair(G)
 
-        routes = []
-        colors = []
-        # short = ox.shortest_path(G, orig, dest, weight='travel_time_a')
-        for subject in subjects.keys():
-            weight = 'rdd_'+subject
-            route = ox.shortest_path(G, orig, dest, weight=weight)
-
-            if route is None: continue
-            routes.append(route)
-            colors.append(subjects[subject]['color'])
+            routes = []
+            colors = []
+            # short = ox.shortest_path(G, orig, dest, weight='travel_time_a')
+            for subject in subjects.keys():
+                weight = 'rdd_'+subject
+                route = ox.shortest_path(G, orig, dest, weight=store.weight(weight))
 
-            rdd = (np.sum(ox.utils_graph.get_route_edge_attributes(G, route, 'rdd_'+subject)))
-            distance = (np.sum(ox.utils_graph.get_route_edge_attributes(G, route, 'length')))
-            energy = (np.sum(ox.utils_graph.get_route_edge_attributes(G, route, 'energy_'+subject)))
-            traveltime = (np.sum(ox.utils_graph.get_route_edge_attributes(G, route, 'travel_time_'+subject)))
+                if route is None: continue
+                routes.append(route)
+                colors.append(subjects[subject]['color'])
 
-            print(f"\tRoute {subject} corresponds to inhaling {rdd:.2f} ug of PM2.5, exerting {energy:.2f} J over {traveltime/60:.2f} minutes, covering {distance:.2f} m")
+                rdd = store.route_sum(route, 'rdd_'+subject)
+                distance = store.route_sum(route, 'length')
+                energy = store.route_sum(route, 'energy_'+subject)
+                traveltime = store.route_sum(route, 'travel_time_'+subject)
 
-        fig, ax = ox.plot_graph_routes(G, routes=routes, route_colors=colors, node_size=0, figsize=(24,16), show=False)
-        ax.set_axis_off()
+                print(f"\tRoute {subject} corresponds to inhaling {rdd:.2f} ug of PM2.5, exerting {energy:.2f} J over {traveltime/60:.2f} minutes, covering {distance:.2f} m")
 
-        fig.savefig('img_fit/route_'+str(j)+'.png', dpi=300, bbox_inches='tight', transparent=True)
+            renderer.routes('img_fit/route_'+str(j)+'.png', [segments.route_lines(store.route_edges(route)) for route in routes], colors)
+        renderer.close()
 
-# generate and plot routes for each subject in the commute monitoring study's commute
-elif mode == "commute":
-    subjects = {0: 'A', 1: 'B', 2: 'C', 3: 'D'}
-    origins = {'A': {'lat': 51.51789, 'lng': -0.08308}, 'B': {'lat': 51.45396, 'lng': -0.17366},  'C': {'lat': 51.517333, 'lng': -0.250967}}
-    destination = {'lat': 51.499824, 'lng': -0.174377}
-    G2 = ox.project_graph(G, to_crs='4326') 
+    # generate and plot routes for each subject in the commute monitoring study's commute
+    elif mode == "commute":
+        subjects = {0: 'A', 1: 'B', 2: 'C', 3: 'D'}
+        origins = {'A': {'lat': 51.51789, 'lng': -0.08308}, 'B': {'lat': 51.45396, 'lng': -0.17366},  'C': {'lat': 51.517333, 'lng': -0.250967}}
+        destination = {'lat': 51.499824, 'lng': -0.174377}
+        G2 = ox.project_graph(G, to_crs='4326') 
 
-    point = (destination['lat'], destination['lng'])
-    dest_node = ox.get_nearest_node(G2, point, return_dist=False)
+        point = (destination['lat'], destination['lng'])
+        dest_node = ox.get_nearest_node(G2, point, return_dist=False)
 
-    routes = []
+        routes = []
 
-    for pt in origins.values():
-        point = (pt['lat'], pt['lng'])
-        node = ox.get_nearest_node(G2, point, return_dist=False)
+        for pt in origins.values():
+            point = (pt['lat'], pt['lng'])
+            node = ox.get_nearest_node(G2, point, return_dist=False)
         
-        routes.append(ox.shortest_path(G, node, dest_node, weight='rdd_a'))
-        # routes.append(ox.shortest_path(G, node, dest_node, weight='travel_time_a'))
-
-    for i, route in enumerate(routes):
-        if route is None: continue
-
-        rdd = (np.sum(ox.utils_graph.get_route_edge_attributes(G, route, "rdd_a")))
-        distance = (np.sum(ox.utils_graph.get_route_edge_attributes(G, route, "length")))
-        energy = (np.sum(ox.utils_graph.get_route_edge_attributes(G, route, "energy_a")))
-        traveltime = (np.sum(ox.utils_graph.get_route_edge_attributes(G, route, "travel_time_a")))
+            routes.append(ox.shortest_path(G, node, dest_node, weight=store.weight('rdd_a')))
+            # routes.append(ox.shortest_path(G, node, dest_node, weight='travel_time_a'))
 
-        print(f"\tRoute {subjects[i]} corresponds to inhaling {rdd:.2f} ug of PM2.5, exerting {energy:.2f} J over {traveltime/60:.2f} minutes, covering {distance:.2f} m")
-
-    fig, ax = ox.plot_graph_routes(G, routes=routes, route_colors=['r','g','b'], node_size=0, figsize=(24,16), show=False)
-    ax.set_axis_off()
-
-    fig.savefig('commute_routes.png', dpi=300, bbox_inches='tight', transparent=True)
-
-# conduct statistical analysis of the routes for each subject
-elif mode == "stats":
-    rdd_dict = {'rdd_a_slow': [], 'rdd_a_fast': []}
-
-    for j in range(500):
-        orig = list(G)[np.random.randint(len(list(G)))]
-        dest = orig
-        while dest == orig:
-            dest = list(G)[np.random.randint(len(list(G)))]
-
-        for subject in subjects.keys():
-            weight = 'rdd_'+subject
-            route = ox.shortest_path(G, orig, dest, weight=weight)
-            
+        for i, route in enumerate(routes):
             if route is None: continue
 
-            rdd = (np.sum(ox.utils_graph.get_route_edge_attributes(G, route, weight)))
-            rdd_dict[weight].append(rdd)
-
-    print(f"A: {np.mean(rdd_dict['rdd_a_slow'])} ug m-3\tB: {np.mean(rdd_dict['rdd_a_fast'])} ug m-3")
-    print(ttest_ind(rdd_dict['rdd_a_slow'], rdd_dict['rdd_a_fast'], alternative='greater'))
+            rdd = store.route_sum(route, "rdd_a")
+            distance = store.route_sum(route, "length")
+            energy = store.route_sum(route, "energy_a")
+            traveltime = store.route_sum(route, "travel_time_a")
+
+            print(f"\tRoute {subjects[i]} corresponds to inhaling {rdd:.2f} ug of PM2.5, exerting {energy:.2f} J over {traveltime/60:.2f} minutes, covering {distance:.2f} m")
+
+        segments = EdgeSegments.from_graph(G)
+        renderer = Renderer(BaseMap(segments, figsize=(24,16), dpi=300, color='#999999', linewidth=1))
+        lines = [segments.route_lines(store.route_edges(route)) for route in routes if route is not None]
+        renderer.routes('commute_routes.png', lines, [c for route, c in zip(routes, ['r','g','b']) if route is not None])
+        renderer.close()
+
+    # conduct statistical analysis of the routes for each subject
+    elif mode == "stats":
+        rdd_dict = {'rdd_a_slow': [], 'rdd_a_fast': []}
+        # degree-2 chains are contracted once, routes and their costs are identical to the full graph's
+        contracted = ContractedGraph(store, list(rdd_dict.keys()))
+
+        # sample O-D pairs in batches until the paired difference is decided, at most 500 pairs as before, analysed at 5 looks
+        batch_size = 20
+        test = SequentialTest(alpha=0.05, max_n=500, looks=5, precision=None)
+        decision = None
+        while decision is None:
+            diffs = []
+            for j in range(batch_size):
+                orig, dest = random_od_pair(G)
+
+                rdds = []
+                for weight in rdd_dict.keys():
+                    route, eids = contracted.route(orig, dest, weight)
+                    if route is None: break
+                    rdds.append(store[weight][eids].sum(dtype=float))
+                if len(rdds) < len(rdd_dict): continue
+
+                for weight, rdd in zip(rdd_dict.keys(), rdds):
+                    rdd_dict[weight].append(rdd)
+                diffs.append(rdds[0] - rdds[1])
+            look = test.look
+            decision = test.update(diffs)
+            if test.look > look:
+                lower, upper = test.bounds()
+                print(f"Look {test.look} of {test.looks}, {test.n} pairs:\tmean difference {test.mean:.3f} ug, {(1-test.alpha)*100:.0f}% repeated confidence interval [{lower:.3f}, {upper:.3f}]")
+
+        print(f"A: {np.mean(rdd_dict['rdd_a_slow'])} ug m-3\tB: {np.mean(rdd_dict['rdd_a_fast'])} ug m-3")
+        print(f"Stopped after {test.n} pairs ({2*test.n} shortest paths): A-B difference {decision}")
+
+    # benchmark k-alternative low-RDD routes against Yen's algorithm on the commutes and random pairs
+    elif mode == "alternatives":
+        k = 3
+        weight = 'rdd_'+list(subjects.keys())[0]
+        origins = {'A': {'lat': 51.51789, 'lng': -0.08308}, 'B': {'lat': 51.45396, 'lng': -0.17366},  'C': {'lat': 51.517333, 'lng': -0.250967}}
+        destination = {'lat': 51.499824, 'lng': -0.174377}
+        G2 = ox.project_graph(G, to_crs='4326')
+
+        dest_node = ox.get_nearest_node(G2, (destination['lat'], destination['lng']), return_dist=False)
+        pairs = {name: (ox.get_nearest_node(G2, (pt['lat'], pt['lng']), return_dist=False), dest_node) for name, pt in origins.items()}
+        for j in range(50):
+            pairs[j] = random_od_pair(G)
+
+        # Yen's algorithm in osmnx requires the weight as an edge attribute
+        store.attach([weight])
+        timings = {'plateau': [], 'penalty': [], 'yen': []}
+        for name, (orig, dest) in pairs.items():
+            t0 = perf_counter()
+            routes = alternative_routes(G, orig, dest, store.weight(weight), k=k)
+            timings['plateau'].append(perf_counter()-t0)
+            if not routes: continue
+
+            # the penalty method is timed on every pair, and fills in where there are too few plateaus
+            t0 = perf_counter()
+            penalised = penalty_routes(G, orig, dest, store.weight(weight), k=k)
+            timings['penalty'].append(perf_counter()-t0)
+            for route in penalised:
+                if len(routes) < k and route not in routes and overlap(G, route, routes) <= 0.5:
+                    routes.append(route)
+
+            t0 = perf_counter()
+            yen = list(ox.k_shortest_paths(G, orig, dest, k, weight=weight))
+            timings['yen'].append(perf_counter()-t0)
+
+            if isinstance(name, str):
+                print(f"COMMUTE {name}:")
+                for i, route in enumerate(routes):
+                    rdd = store.route_sum(route, weight)
+                    distance = store.route_sum(route, 'length')
+                    shared = overlap(G, route, routes[:i])
+                    print(f"\tOption {i} corresponds to inhaling {rdd:.2f} ug of PM2.5 over {distance:.2f} m, sharing {shared*100:.1f}% with earlier options")
+
+        print(f"Plateau alternatives:\t{np.mean(timings['plateau'])*1000:.1f} ms mean, {np.percentile(timings['plateau'], 95)*1000:.1f} ms p95")
+        print(f"Penalty alternatives:\t{np.mean(timings['penalty'])*1000:.1f} ms mean, {np.percentile(timings['penalty'], 95)*1000:.1f} ms p95")
+        print(f"Yen's k-shortest:\t{np.mean(timings['yen'])*1000:.1f} ms mean, {np.percentile(timings['yen'], 95)*1000:.1f} ms p95")
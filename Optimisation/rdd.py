@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 def vent_rate(sex, hr):
     '''
@@ -6,16 +7,16 @@ def vent_rate(sex, hr):
 
             Parameters:
                     sex (str): 'M' or 'F', the sex of the individual
-                    HR (float): The heart rate for the period of interest, bpm
+                    HR (float or np.ndarray): The heart rate for the period of interest, bpm
 
             Returns:
-                    VR (float): Ventilation rate of the individual, L/min
+                    VR (float or np.ndarray): Ventilation rate of the individual, L/min
     '''
     
     if sex=='M':
-        return math.exp(0.021*hr + 1.03)
+        return np.exp(0.021*hr + 1.03)
     else:
-        return math.exp(0.023*hr + 0.57)
+        return np.exp(0.023*hr + 0.57)
 
 def inhaled_frac(mmd):
     '''
@@ -0,0 +1,216 @@
+import os
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+
+class EdgeSegments:
+    '''
+    Line-segment arrays of every edge of the travel graph, built once and sliced for each figure.
+
+    Coordinates of all edges are held in one flat array; edge i spans coords[offsets[i]:offsets[i+1]].
+    '''
+    def __init__(self, lines):
+        '''
+                Parameters:
+                        lines (list of np.ndarray): (n, 2) x/y coordinates of every edge, in edge order
+        '''
+        self.offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum([len(line) for line in lines])
+        self.coords = np.concatenate(lines).astype(np.float64) if lines else np.empty((0, 2))
+
+    @classmethod
+    def from_graph(cls, G):
+        '''
+        Returns the segments of a graph in G.edges() order, i.e. indexed by WeightStore edge id.
+        '''
+        lines = []
+        for u, v, data in G.edges(data=True):
+            if 'geometry' in data:
+                lines.append(np.asarray(data['geometry'].coords))
+            else:
+                lines.append(np.array([[G.nodes[u]['x'], G.nodes[u]['y']], [G.nodes[v]['x'], G.nodes[v]['y']]]))
+        return cls(lines)
+
+    @classmethod
+    def from_gdf(cls, edges):
+        '''
+        Returns the segments of an edge GeoDataFrame, indexed by row position.
+        '''
+        return cls([np.asarray(geom.coords) for geom in edges.geometry])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def lines(self, idx=None):
+        '''
+        Returns the coordinate arrays of the selected edges, all edges if None.
+        '''
+        if idx is None:
+            idx = range(len(self))
+        return [self.coords[self.offsets[i]:self.offsets[i+1]] for i in idx]
+
+    def route_lines(self, eids):
+        '''
+        Returns a single coordinate array following a route's edges in order.
+        '''
+        return np.concatenate(self.lines(eids)) if len(eids) else np.empty((0, 2))
+
+    def bounds(self):
+        '''
+        Returns the (xmin, xmax, ymin, ymax) extent of every edge.
+        '''
+        return (self.coords[:, 0].min(), self.coords[:, 0].max(), self.coords[:, 1].min(), self.coords[:, 1].max())
+
+class BaseMap:
+    '''
+    The grey street layer, rasterised once per extent and figure size and cached to disk.
+    '''
+    def __init__(self, segments, figsize=(18,12), dpi=300, color='dimgray', linewidth=0.5, extent=None, cache_dir='img_cache'):
+        '''
+                Parameters:
+                        segments (EdgeSegments): Every edge of the travel graph
+                        figsize (tuple): Figure size of the figures drawn on the base map, in
+                        dpi (int): Resolution of the base map and of the figures, dots per inch
+                        color (str): Colour of the street lines
+                        linewidth (float): Width of the street lines
+                        extent (tuple): (xmin, xmax, ymin, ymax) to draw, the graph's bounds if None
+                        cache_dir (str): Directory in which rasters are cached
+        '''
+        self.figsize = figsize
+        self.dpi = dpi
+        self.extent = fit_extent(extent if extent is not None else segments.bounds(), figsize)
+
+        tag = repr((self.extent, figsize, dpi, color, linewidth, len(segments), segments.coords.sum()))
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, 'basemap_' + hashlib.sha1(tag.encode()).hexdigest()[:12] + '.npy')
+        if not os.path.exists(self.path):
+            np.save(self.path, rasterise(segments.lines(), self.extent, figsize, dpi, color, linewidth))
+
+def fit_extent(extent, figsize, pad=0.02):
+    '''
+    Returns an extent padded and widened to the aspect ratio of the figure.
+    '''
+    xmin, xmax, ymin, ymax = extent
+    w, h = (xmax - xmin) * (1 + pad), (ymax - ymin) * (1 + pad)
+    aspect = figsize[0] / figsize[1]
+    if w / h < aspect:
+        w = h * aspect
+    else:
+        h = w / aspect
+    cx, cy = (xmin + xmax) / 2, (ymin + ymax) / 2
+    return (cx - w/2, cx + w/2, cy - h/2, cy + h/2)
+
+def rasterise(lines, extent, figsize, dpi, color, linewidth):
+    '''
+    Returns an RGBA image of the given lines, covering exactly the extent.
+    '''
+    fig = plt.figure(figsize=figsize, dpi=dpi)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    ax.add_collection(LineCollection(lines, colors=color, linewidths=linewidth))
+    ax.set_xlim(extent[0], extent[1])
+    ax.set_ylim(extent[2], extent[3])
+    fig.patch.set_alpha(0)
+    fig.canvas.draw()
+    image = np.asarray(fig.canvas.buffer_rgba()).copy()
+    plt.close(fig)
+    return image
+
+# rasters loaded by each rendering process, keyed by cache path
+rasters = {}
+
+def base_axes(basemap_path, extent, figsize, dpi):
+    '''
+    Returns a figure with the cached base map drawn over the extent.
+    '''
+    if basemap_path not in rasters:
+        rasters[basemap_path] = np.load(basemap_path, mmap_mode='r')
+    fig = plt.figure(figsize=figsize, dpi=dpi)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    ax.imshow(rasters[basemap_path], extent=extent, aspect='auto', interpolation='none', zorder=0)
+    ax.set_xlim(extent[0], extent[1])
+    ax.set_ylim(extent[2], extent[3])
+    return fig, ax
+
+def draw_routes(filepath, basemap_path, extent, figsize, dpi, routes, colors):
+    '''
+    Saves a figure of routes over the base map, in the style of ox.plot_graph_routes().
+
+            Parameters:
+                    filepath (str): Path of the saved figure
+                    basemap_path (str): Cached base map raster, see BaseMap
+                    extent (tuple): (xmin, xmax, ymin, ymax) of the base map
+                    figsize (tuple): Figure size, in
+                    dpi (int): Resolution, dots per inch
+                    routes (list of np.ndarray): (n, 2) coordinates of every route
+                    colors (list of str): Colour of every route
+    '''
+    fig, ax = base_axes(basemap_path, extent, figsize, dpi)
+    ax.add_collection(LineCollection(routes, colors=colors, linewidths=4, alpha=0.5, zorder=1))
+    fig.savefig(filepath, dpi=dpi, transparent=True)
+    plt.close(fig)
+
+def draw_heatmap(filepath, basemap_path, extent, figsize, dpi, lines, values, vmax=None, cmap='inferno', label="PM2.5 (ug / m3)"):
+    '''
+    Saves a figure of edges coloured by value over the base map, with a horizontal colour bar.
+
+            Parameters:
+                    filepath (str): Path of the saved figure
+                    basemap_path (str): Cached base map raster, see BaseMap
+                    extent (tuple): (xmin, xmax, ymin, ymax) of the base map
+                    figsize (tuple): Figure size, in
+                    dpi (int): Resolution, dots per inch
+                    lines (list of np.ndarray): (n, 2) coordinates of every coloured edge
+                    values (np.ndarray): Value of every coloured edge
+                    vmax (float): Upper limit of the colour scale, the maximum value if None
+                    cmap (str): Name of the colour map
+                    label (str): Colour bar label
+    '''
+    fig, ax = base_axes(basemap_path, extent, figsize, dpi)
+    collection = LineCollection(lines, array=np.asarray(values, dtype=float), cmap=cmap, linewidths=1.5, zorder=1)
+    collection.set_clim(np.nanmin(values), vmax if vmax is not None else np.nanmax(values))
+    ax.add_collection(collection)
+    cax = fig.add_axes([0.2, 0.08, 0.6, 0.02])
+    fig.colorbar(collection, cax=cax, orientation='horizontal', label=label)
+    fig.savefig(filepath, dpi=dpi, transparent=True)
+    plt.close(fig)
+
+class Renderer:
+    '''
+    Draws route and heatmap figures on a cached base map in a background process pool.
+    '''
+    def __init__(self, basemap, workers=2):
+        self.basemap = basemap
+        # forking after TensorFlow is loaded, or on macOS, is unsafe, so workers are spawned and callers need a __main__ guard
+        self.pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        self.jobs = []
+
+    def routes(self, filepath, routes, colors):
+        '''
+        Queues a route figure, see draw_routes().
+        '''
+        b = self.basemap
+        self.jobs.append(self.pool.submit(draw_routes, filepath, b.path, b.extent, b.figsize, b.dpi, routes, colors))
+
+    def heatmap(self, filepath, lines, values, **kwargs):
+        '''
+        Queues a heatmap figure, see draw_heatmap().
+        '''
+        b = self.basemap
+        self.jobs.append(self.pool.submit(draw_heatmap, filepath, b.path, b.extent, b.figsize, b.dpi, lines, np.asarray(values), **kwargs))
+
+    def close(self):
+        '''
+        Waits for every queued figure, raising any error from the rendering processes.
+        '''
+        for job in self.jobs:
+            job.result()
+        self.pool.shutdown()
+        self.jobs = []
@@ -0,0 +1,330 @@
+import asyncio
+import json
+import math
+from collections import OrderedDict
+from time import perf_counter
+
+import numpy as np
+import osmnx as ox
+import networkx as nx
+from scipy.spatial import cKDTree
+
+from weights import profile_key, profile_params
+from weight_store import WeightStore
+
+import warnings
+warnings.filterwarnings("ignore")
+
+# ----- PARAMS
+graph_file = '../Mapping/data/London.graphml'
+host = '127.0.0.1'
+port = 8765
+ambient_pm = 10 # ug/m3
+cache_size = 10000 # routes held in the LRU cache
+max_profiles = 32 # profiles whose weights are held in the weight store
+batch_window = 0.005 # s to wait for concurrent requests to join a batch
+batch_size = 64 # maximum number of queries routed per batch
+metrics = ['rdd', 'energy', 'travel_time']
+
+class RouteCache:
+    '''
+    Least-recently-used cache of routing results keyed by snapped node pair and profile hash.
+    '''
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        '''
+        Returns the cached result for a key, or None, marking it as recently used.
+        '''
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        '''
+        Stores a result, evicting the least recently used entry when full.
+        '''
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def drop(self, profile):
+        '''
+        Removes every cached result of a profile.
+        '''
+        for key in [k for k in self.entries if k[2] == profile]:
+            del self.entries[key]
+
+class RouteService:
+    '''
+    Keeps the travel graph and the weights of recently requested profiles resident, and answers routing queries in batches.
+
+    Profiles are evicted least-recently-used beyond max_profiles, together with their
+    cached routes, unless a query for them is in flight.
+    '''
+    def __init__(self, G, ambient_pm, max_profiles=max_profiles):
+        self.G = G
+        self.ambient_pm = ambient_pm
+        self.max_profiles = max_profiles
+        self.profiles = OrderedDict()
+        self.weighting = {} # profile hash -> task computing its weights
+        self.in_flight = {} # profile hash -> number of queries awaiting a route
+        self.cache = RouteCache(cache_size)
+        self.queue = asyncio.Queue()
+        self.store = WeightStore(G)
+
+        # nodes are snapped on a kd-tree built once, with longitude scaled by cos(lat) to be roughly isotropic
+        self.nodes = np.array(list(G.nodes), dtype=np.int64)
+        xy = np.array([(G.nodes[n]['x'], G.nodes[n]['y']) for n in self.nodes], dtype=float)
+        self.scale = math.cos(math.radians(xy[:, 1].mean()))
+        self.tree = cKDTree(np.column_stack([xy[:, 0] * self.scale, xy[:, 1]]))
+
+    def weigh(self, key, subject):
+        '''
+        Computes and stores the edge weights of a profile, run off the event loop.
+        '''
+        t0 = perf_counter()
+        self.store.add_profile(key, subject, self.ambient_pm)
+        print(f"Weighted profile {key} in {perf_counter()-t0:.2f} s")
+
+    async def add_profile(self, subject):
+        '''
+        Returns the hash of a subject profile, computing its edge weights the first time it is seen.
+
+                Parameters:
+                        subject (dict): Dictionary containing subject's physiological attributes
+
+                Returns:
+                        key (str): Profile hash used in the weight store's column names
+        '''
+        key = profile_key(subject)
+        if key in self.profiles:
+            self.profiles.move_to_end(key)
+            return key
+
+        # concurrent requests for a new profile share one weighting task
+        task = self.weighting.get(key)
+        if task is None:
+            task = asyncio.ensure_future(asyncio.get_running_loop().run_in_executor(None, self.weigh, key, subject))
+            self.weighting[key] = task
+            task.add_done_callback(lambda t: self.weighting.pop(key, None))
+        await task
+        if key not in self.profiles:
+            if key not in self.store.profiles:
+                return await self.add_profile(subject) # evicted before this request resumed
+            self.profiles[key] = {p: subject[p] for p in profile_params}
+            self.evict(keep=key)
+        return key
+
+    def evict(self, keep=None):
+        '''
+        Drops the least recently used profiles beyond max_profiles, skipping those with queries in flight.
+        '''
+        for old in list(self.profiles.keys()):
+            if len(self.profiles) <= self.max_profiles:
+                break
+            if old != keep and not self.in_flight.get(old):
+                del self.profiles[old]
+                self.store.drop_profile(old)
+                self.cache.drop(old)
+
+    def snap(self, points):
+        '''
+        Returns the nearest graph nodes to a list of (lat, lng) points.
+        '''
+        pts = np.array(points, dtype=float).reshape(-1, 2)
+        _, idx = self.tree.query(np.column_stack([pts[:, 1] * self.scale, pts[:, 0]]))
+        return self.nodes[idx].tolist()
+
+    def summarise(self, route, key):
+        '''
+        Returns the RDD, distance, energy and travel time of a route, using the edge chosen by the router.
+        '''
+        eids = self.store.route_edges(route, 'rdd_'+key)
+        result = {'path': [int(n) for n in route], 'distance': float(self.store['length'][eids].sum(dtype=float))}
+        for metric in metrics:
+            result[metric] = float(self.store[metric+'_'+key][eids].sum(dtype=float))
+        return result
+
+    def route_batch(self, queries):
+        '''
+        Returns the results of a batch of (origin node, destination node, profile hash) queries.
+
+        Queries sharing an origin and profile are served by a single shortest-path tree.
+        '''
+        groups = {}
+        for orig, dest, key in queries:
+            groups.setdefault((orig, key), set()).add(dest)
+
+        results = {}
+        for (orig, key), dests in groups.items():
+            weight = self.store.weight('rdd_'+key)
+            if len(dests) == 1:
+                dest = next(iter(dests))
+                try:
+                    paths = {dest: nx.bidirectional_dijkstra(self.G, orig, dest, weight=weight)[1]}
+                except nx.NetworkXNoPath:
+                    paths = {}
+            else:
+                paths = nx.single_source_dijkstra_path(self.G, orig, weight=weight)
+            for dest in dests:
+                route = paths.get(dest)
+                results[(orig, dest, key)] = None if route is None else self.summarise(route, key)
+        return results
+
+    async def query(self, origin, destination, subject):
+        '''
+        Returns the route between two (lat, lng) points for a subject, from the cache where possible.
+        '''
+        key = await self.add_profile(subject)
+        self.in_flight[key] = self.in_flight.get(key, 0) + 1
+        try:
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((origin, destination, key, future))
+            return await future
+        finally:
+            self.in_flight[key] -= 1
+            if not self.in_flight[key]:
+                del self.in_flight[key]
+                self.evict()
+
+    async def batcher(self):
+        '''
+        Collects concurrent queries into batches and routes them off the event loop.
+        '''
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + batch_window
+            while len(batch) < batch_size:
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                nodes = await loop.run_in_executor(None, self.snap, [pt for q in batch for pt in q[:2]])
+            except Exception as e:
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            pending = {}
+            for i, (_, _, key, future) in enumerate(batch):
+                cache_key = (nodes[2*i], nodes[2*i+1], key)
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    future.set_result(dict(cached, cached=True))
+                else:
+                    pending.setdefault(cache_key, []).append(future)
+
+            if pending:
+                try:
+                    results = await loop.run_in_executor(None, self.route_batch, list(pending.keys()))
+                except Exception as e:
+                    for futures in pending.values():
+                        for future in futures:
+                            future.set_exception(e)
+                    continue
+                for cache_key, futures in pending.items():
+                    result = results[cache_key]
+                    if result is not None:
+                        self.cache.put(cache_key, result)
+                    for future in futures:
+                        future.set_result(None if result is None else dict(result, cached=False))
+
+def parse_point(value):
+    '''
+    Returns a (lat, lng) pair of floats, raising ValueError if the value is not two finite numbers.
+    '''
+    if not isinstance(value, (list, tuple)) or len(value) != 2 or \
+       not all(isinstance(x, (int, float)) and not isinstance(x, bool) and math.isfinite(x) for x in value):
+        raise ValueError(f"expected [lat, lng] as two numbers, got {value!r}")
+    return float(value[0]), float(value[1])
+
+async def respond(writer, status, body):
+    '''
+    Writes a JSON response to the client.
+    '''
+    payload = json.dumps(body).encode()
+    writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload)
+    await writer.drain()
+
+async def handle(service, reader, writer):
+    '''
+    Serves HTTP/1.1 keep-alive connections.
+
+    POST /route with {"origin": [lat, lng], "destination": [lat, lng], "subject": {...}}
+    returns the path with its RDD (ug), distance (m), energy (J) and travel time (s).
+    GET /stats returns the cache statistics.
+    '''
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, path, _ = request_line.decode().split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, value = line.decode().split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length < 0:
+                    raise ValueError(f"negative Content-Length {length}")
+            except ValueError as e:
+                # the rest of the stream cannot be framed, so the connection is closed after the response
+                await respond(writer, '400 Bad Request', {'error': f"malformed request: {e}"})
+                break
+            body = await reader.readexactly(length)
+
+            if method == 'GET' and path == '/stats':
+                await respond(writer, '200 OK', {'profiles': len(service.profiles), 'cached': len(service.cache.entries),
+                                                 'hits': service.cache.hits, 'misses': service.cache.misses})
+            elif method == 'POST' and path == '/route':
+                try:
+                    q = json.loads(body)
+                    origin, destination = parse_point(q['origin']), parse_point(q['destination'])
+                    result = await service.query(origin, destination, q['subject'])
+                except (ValueError, KeyError, TypeError) as e:
+                    await respond(writer, '400 Bad Request', {'error': str(e)})
+                    continue
+                except Exception as e:
+                    await respond(writer, '500 Internal Server Error', {'error': repr(e)})
+                    continue
+                if result is None:
+                    await respond(writer, '404 Not Found', {'error': 'no path between the snapped nodes'})
+                else:
+                    await respond(writer, '200 OK', result)
+            else:
+                await respond(writer, '404 Not Found', {'error': 'unknown endpoint'})
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def main():
+    t0 = perf_counter()
+    G = ox.load_graphml(graph_file)
+    service = RouteService(G, ambient_pm)
+    print(f"Loaded graph with {len(G.edges)} edges in {perf_counter()-t0:.2f} s")
+
+    asyncio.get_running_loop().create_task(service.batcher())
+    server = await asyncio.start_server(lambda r, w: handle(service, r, w), host, port)
+    print(f"Serving routes on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == '__main__':
+    asyncio.run(main())
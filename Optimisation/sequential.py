@@ -0,0 +1,152 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+from scipy.stats import norm, t as student_t
+
+@lru_cache(maxsize=None)
+def boundary_constant(looks, alpha, kind='obrien-fleming', sims=200000, seed=0):
+    '''
+    Returns the constant of a two-sided group-sequential boundary with equally spaced looks.
+
+    The z boundary at look k of K is c * sqrt(K/k) for O'Brien-Fleming and c for Pocock.
+    c is the 1 - alpha quantile of the largest scaled |z| over the looks of a null
+    Brownian motion, simulated with a fixed seed so the boundary is reproducible.
+
+            Parameters:
+                    looks (int): Number of analyses, K
+                    alpha (float): Probability of crossing the boundary at any look under the null
+                    kind (str): 'obrien-fleming' or 'pocock'
+                    sims (int): Number of simulated paths
+                    seed (int): Random seed of the simulation
+
+            Returns:
+                    c (float): Boundary constant
+    '''
+    if kind not in ('obrien-fleming', 'pocock'):
+        raise ValueError(f"Unknown boundary {kind}, expected 'obrien-fleming' or 'pocock'")
+    k = np.arange(1, looks + 1)
+    z = np.cumsum(np.random.default_rng(seed).standard_normal((sims, looks)), axis=1) / np.sqrt(k)
+    shape = np.sqrt(looks / k) if kind == 'obrien-fleming' else np.ones(looks)
+    return float(np.quantile((np.abs(z) / shape).max(axis=1), 1 - alpha))
+
+class SequentialTest:
+    '''
+    A two-sided group-sequential paired t-test that the mean of paired differences is zero.
+
+    Differences are added batch by batch, and the test is analysed at a fixed number of
+    equally spaced looks up to max_n. At each look the t statistic is compared with the
+    O'Brien-Fleming (or Pocock) boundary, so the probability of a false decision over all
+    looks is alpha. O'Brien-Fleming spends little alpha at the early, small-sample looks.
+
+    RDD differences grow with route length and are right-skewed, which biases the plain
+    t statistic, so Johnson's (1978) skewness-corrected t is used:
+        t = (d + m3 / (6 s^2 n) + m3 d^2 / (3 s^4)) / (s / sqrt(n))
+    with d the mean difference, s^2 its variance and m3 its third central moment.
+
+    The test stops when the mean is significantly positive (positive) or negative
+    (not positive), when the repeated confidence interval is narrower than the precision
+    target (inconclusive at that precision), or at the last look (exhausted).
+    '''
+    def __init__(self, alpha=0.05, max_n=500, looks=5, kind='obrien-fleming', precision=None):
+        '''
+                Parameters:
+                        alpha (float): Error probability of the decision, over both sides and every look
+                        max_n (int): Number of observations at the last look
+                        looks (int): Number of analyses, equally spaced up to max_n
+                        kind (str): Boundary shape, 'obrien-fleming' or 'pocock'
+                        precision (float): Half-width of the repeated confidence interval at which to stop, never if None
+        '''
+        self.alpha = alpha
+        self.max_n = max_n
+        self.looks = looks
+        self.precision = precision
+        self.at = [math.ceil(k * max_n / looks) for k in range(1, looks + 1)] # observations at each look
+        c = boundary_constant(looks, alpha, kind)
+        self.z = [c * math.sqrt(looks / k) if kind == 'obrien-fleming' else c for k in range(1, looks + 1)]
+        self.look = 0 # looks analysed so far
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # sum of squared deviations from the mean
+        self.m3 = 0.0 # sum of cubed deviations from the mean
+
+    def update(self, diffs):
+        '''
+        Adds a batch of paired differences and returns the decision, None to continue sampling.
+
+        The test is analysed once the sample reaches the next look, at the latest look reached.
+
+                Parameters:
+                        diffs (array-like): Paired differences, e.g. RDD of profile A minus profile B on the same O-D pair
+
+                Returns:
+                        decision (str): 'positive', 'not positive', 'precision', 'exhausted', or None
+        '''
+        diffs = np.asarray(diffs, dtype=float)
+        if len(diffs):
+            # Chan et al. / Pebay parallel update of the running mean, variance and third moment
+            n, mean = len(diffs), diffs.mean()
+            m2, m3 = ((diffs - mean)**2).sum(), ((diffs - mean)**3).sum()
+            delta = mean - self.mean
+            total = self.n + n
+            self.m3 += m3 + delta**3 * self.n * n * (self.n - n) / total**2 + 3 * delta * (self.n * m2 - n * self.m2) / total
+            self.m2 += m2 + delta**2 * self.n * n / total
+            self.mean += delta * n / total
+            self.n = total
+
+        look = self.look
+        while look < self.looks and self.n >= self.at[look]:
+            look += 1
+        if look == self.look:
+            return None
+        self.look = look
+        return self.decision()
+
+    @property
+    def var(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else math.inf
+
+    def critical(self):
+        '''
+        Returns the t boundary at the latest look, the z boundary carried to the t distribution at the current sample size.
+        '''
+        if self.look == 0 or self.n < 2:
+            return math.inf
+        return student_t.ppf(norm.cdf(self.z[self.look - 1]), self.n - 1)
+
+    def bounds(self):
+        '''
+        Returns the (lower, upper) repeated confidence interval of the mean at the latest look.
+
+        The interval holds the means whose corrected t statistic is within the boundary,
+        and the intervals of every look hold together with probability 1 - alpha.
+        '''
+        if self.look == 0 or self.n < 2 or self.var == 0:
+            return -math.inf, math.inf
+        se = math.sqrt(self.var / self.n)
+        mu3 = self.m3 / self.n
+        a, b = mu3 / (6 * self.var * self.n), mu3 / (3 * self.var**2)
+
+        def offset(k):
+            # root of b x^2 + x + a = k nearest zero, x = mean - bound, on the branch where t rises with x
+            if abs(b) * se < 1e-12:
+                return k - a
+            disc = 1 - 4 * b * (a - k)
+            return (-1 + math.sqrt(disc)) / (2 * b) if disc >= 0 else math.copysign(math.inf, k)
+        c = self.critical() * se
+        return self.mean - offset(c), self.mean - offset(-c)
+
+    def decision(self):
+        '''
+        Returns the decision at the latest look, None to continue sampling.
+        '''
+        lower, upper = self.bounds()
+        if lower > 0:
+            return 'positive'
+        if upper < 0:
+            return 'not positive'
+        if self.precision is not None and (upper - lower) / 2 <= self.precision:
+            return 'precision'
+        if self.look == self.looks:
+            return 'exhausted'
+        return None
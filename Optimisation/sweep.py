@@ -0,0 +1,213 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+import osmnx as ox
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.stats import ttest_rel
+
+from rdd import deposition_frac, mmd
+from weights import edge_weight_arrays, aero_power, kph_to_mps, profile_params, profile_key
+from weight_store import WeightStore
+
+import warnings
+warnings.filterwarnings("ignore")
+
+# ----- PARAMS
+graph_file = '../Mapping/data/London.graphml'
+results_file = 'sweep_results.csv'
+ambient_pm = 10 # ug/m3
+n_pairs = 500 # O-D pairs routed for every profile
+batch_size = 8 # profiles weighted together in one vectorised batch
+workers = 4
+
+# each parameter is swept over its grid, all other attributes are taken from the base profile
+base = {'hr_0': 60, 'm': 90, 'Tr': 22, 'hr_max': 180, 'c': 0.15, 'kf': 1e-5, 'sex': 'M', 'v': 15}
+grids = {'v': [10, 15, 20, 25, 30],
+         'm': [70, 90, 110],
+         'c': [0.15, 0.3, 0.45],
+         'kf': [1e-5],
+         'Tr': [22, 30],
+         'hr_0': [60, 100],
+         'sex': ['M', 'F']}
+
+def profile_grid(grids, base):
+    '''
+    Returns every subject profile in the cartesian product of the parameter grids.
+
+            Parameters:
+                    grids (dict of list): Values to sweep for each physiological attribute
+                    base (dict): Attributes of the profile not covered by the grids
+
+            Returns:
+                    profiles (list of dict): Subject profiles
+    '''
+    names = list(grids.keys())
+    return [dict(base, **dict(zip(names, values))) for values in itertools.product(*[grids[n] for n in names])]
+
+def shared_terms(store, speeds):
+    '''
+    Returns the profile-independent terms of the weight model, computed once for the whole sweep.
+
+            Parameters:
+                    store (WeightStore): Weight store of the travel graph
+                    speeds (list of float): Every travel velocity in the sweep, km/h
+
+            Returns:
+                    terms (dict): Per-edge 'd_height', 'length' and 'grade', per-speed 'aero' power (W) and the deposition fraction 'df'
+    '''
+    d_height, length = store['d_height'].astype(float), store['length'].astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        grade = d_height / length
+    return {'d_height': d_height, 'length': length, 'grade': grade,
+            'aero': {v: aero_power(kph_to_mps(v)) for v in speeds},
+            'df': deposition_frac(mmd)}
+
+def batch_weights(terms, profiles, ambient_pm):
+    '''
+    Returns the edge weights of a batch of profiles, evaluated together on (profile, edge) arrays.
+
+            Parameters:
+                    terms (dict): Profile-independent terms, see shared_terms()
+                    profiles (list of dict): Subject profiles in the batch
+                    ambient_pm (float or np.ndarray): The concentration of PM2.5 on each edge, ug/m3
+
+            Returns:
+                    weights (dict of np.ndarray): 'rdd' (ug), 'energy' (J) and 'travel_time' (s), shape (profiles, edges)
+    '''
+    columns = {p: np.array([s[p] for s in profiles])[:, None] for p in profile_params}
+    aero = np.array([terms['aero'][s['v']] for s in profiles])[:, None]
+    return edge_weight_arrays(terms['d_height'], terms['length'], columns, ambient_pm, grade=terms['grade'], aero=aero, df=terms['df'])
+
+def edge_index(store):
+    '''
+    Returns the node ids of a weight store's graph and the (source, target) node index of every edge, for csgraph routing.
+    '''
+    nodes = np.unique(np.concatenate([store.u, store.v]))
+    return nodes, np.searchsorted(nodes, store.u), np.searchsorted(nodes, store.v)
+
+def routing_matrix(iu, iv, w, n):
+    '''
+    Returns the sparse routing matrix of a weight column, keeping the lightest of any parallel edges.
+
+            Parameters:
+                    iu (np.ndarray): Source node index of every edge
+                    iv (np.ndarray): Target node index of every edge
+                    w (np.ndarray): Weight of every edge
+                    n (int): Number of nodes
+
+            Returns:
+                    graph (csr_matrix): (n, n) routing matrix
+                    keys (np.ndarray): Sorted iu * n + iv of every entry
+                    eids (np.ndarray): Edge id of every entry, in the order of keys
+    '''
+    order = np.lexsort((w, iv, iu))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (iu[order][1:] != iu[order][:-1]) | (iv[order][1:] != iv[order][:-1])
+    eids = order[first]
+    graph = csr_matrix((w[eids], (iu[eids], iv[eids])), shape=(n, n))
+    return graph, iu[eids].astype(np.int64) * n + iv[eids], eids
+
+# per-worker state, populated once by init_worker()
+worker = {}
+
+def init_worker(graph_file, terms, pairs, ambient_pm):
+    '''
+    Loads the travel graph's edge index into a worker process alongside the shared terms and O-D pairs.
+    '''
+    store = WeightStore(ox.load_graphml(graph_file))
+    worker['terms'] = terms
+    worker['nodes'], worker['iu'], worker['iv'] = edge_index(store)
+    worker['pairs'] = pairs
+    worker['ambient_pm'] = ambient_pm
+
+def run_batch(profiles):
+    '''
+    Returns the stats study of a batch of profiles, run in a worker process.
+
+    Every profile routes the same O-D pairs on its lowest-RDD paths, so results are paired across profiles.
+    Paths are found by scipy's dijkstra over the weight arrays, once per distinct origin.
+
+            Parameters:
+                    profiles (list of dict): Subject profiles in the batch
+
+            Returns:
+                    results (list of dict): Per-profile arrays of 'rdd', 'distance', 'energy' and 'travel_time', NaN where unreachable
+    '''
+    nodes, iu, iv = worker['nodes'], worker['iu'], worker['iv']
+    n = len(nodes)
+    weights = batch_weights(worker['terms'], profiles, worker['ambient_pm'])
+    source = np.searchsorted(nodes, [orig for orig, _ in worker['pairs']])
+    target = np.searchsorted(nodes, [dest for _, dest in worker['pairs']])
+
+    results = []
+    for i in range(len(profiles)):
+        graph, keys, eids = routing_matrix(iu, iv, weights['rdd'][i], n)
+        study = {metric: np.full(len(worker['pairs']), np.nan) for metric in ['rdd', 'distance', 'energy', 'travel_time']}
+        for s in np.unique(source):
+            dist, pred = dijkstra(graph, indices=s, return_predecessors=True)
+            for j in np.flatnonzero(source == s):
+                t = target[j]
+                if not np.isfinite(dist[t]):
+                    continue
+                path = [t]
+                while path[-1] != s:
+                    path.append(pred[path[-1]])
+                path = np.array(path[::-1], dtype=np.int64)
+                route = eids[np.searchsorted(keys, path[:-1] * n + path[1:])]
+                study['distance'][j] = worker['terms']['length'][route].sum()
+                for metric, values in weights.items():
+                    study[metric][j] = values[i][route].sum()
+        results.append(study)
+    return results
+
+def summarise(profiles, studies, reference=0):
+    '''
+    Returns a table of every profile's parameters and study results.
+
+            Parameters:
+                    profiles (list of dict): Subject profiles
+                    studies (list of dict): Per-profile study arrays, see run_batch()
+                    reference (int): Index of the profile which the others are tested against
+
+            Returns:
+                    table (pd.DataFrame): One row per profile, with the paired t-test of RDD against the reference
+    '''
+    rows = []
+    ref = studies[reference]['rdd']
+    for subject, study in zip(profiles, studies):
+        row = dict(subject, profile=profile_key(subject))
+        for metric, values in study.items():
+            row['mean_'+metric] = np.nanmean(values)
+        row['std_rdd'] = np.nanstd(study['rdd'])
+        paired = ~np.isnan(ref) & ~np.isnan(study['rdd'])
+        row['p_greater'] = ttest_rel(study['rdd'][paired], ref[paired], alternative='greater').pvalue if study is not studies[reference] else np.nan
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+if __name__ == '__main__':
+    t0 = perf_counter()
+    G = ox.load_graphml(graph_file)
+    profiles = profile_grid(grids, base)
+    terms = shared_terms(WeightStore(G), grids['v'] if 'v' in grids else [base['v']])
+
+    # the same O-D pairs are used for every profile
+    nodes = list(G)
+    pairs = []
+    while len(pairs) < n_pairs:
+        orig, dest = np.random.choice(len(nodes), 2, replace=False)
+        pairs.append((nodes[orig], nodes[dest]))
+    print(f"Sweeping {len(profiles)} profiles over {n_pairs} O-D pairs, set up in {perf_counter()-t0:.2f} s")
+
+    t0 = perf_counter()
+    batches = [profiles[i:i+batch_size] for i in range(0, len(profiles), batch_size)]
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(graph_file, terms, pairs, ambient_pm)) as pool:
+        studies = [study for batch in pool.map(run_batch, batches) for study in batch]
+    print(f"Time elapsed to weight and route every profile:\t{perf_counter()-t0} s")
+
+    table = summarise(profiles, studies)
+    table.to_csv(results_file, index=False)
+    print(table.sort_values(by=['mean_rdd']).head(20))
@@ -0,0 +1,266 @@
+import os
+import json
+import math
+from collections import OrderedDict
+from time import perf_counter
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+# ----- PARAMS
+graph_file = '../Mapping/data/London.graphml'
+tile_dir = '../Mapping/data/London_tiles'
+tile_size = 0.02 # tile width and height, degrees
+memory_budget = 256e6 # bytes of tile arrays kept resident
+ambient_pm = 10 # ug/m3
+subject = {'hr_0': 60, 'm': 90, 'Tr': 22, 'hr_max': 180, 'c': 0.15, 'kf': 1e-5, 'sex': 'M', 'v': 15}
+
+def tile_of(x, y, size):
+    '''
+    Returns the (column, row) of the tile containing a point.
+
+            Parameters:
+                    x (float or np.ndarray): Longitude, degrees
+                    y (float or np.ndarray): Latitude, degrees
+                    size (float): Tile width and height, degrees
+
+            Returns:
+                    tile (tuple): Column and row indices of the tile
+    '''
+    return np.floor(np.asarray(x) / size).astype(int), np.floor(np.asarray(y) / size).astype(int)
+
+def tile_name(i, j):
+    '''
+    Returns the name of the tile in column i and row j.
+    '''
+    return f"{i}_{j}"
+
+def build_tiles(G, store, out_dir, size=tile_size, columns=None):
+    '''
+    Partitions a travel graph and its weight store into spatial tiles saved as .npz files.
+
+    Every edge is stored with the tile of its source node, so edges leaving a tile
+    carry the overlay onto the boundary nodes of the neighbouring tiles.
+
+            Parameters:
+                    G (nx.MultiDiGraph): The travel graph, unprojected
+                    store (WeightStore): Weight store of the graph
+                    out_dir (str): Directory in which to write the tiles and their index
+                    size (float): Tile width and height, degrees
+                    columns (list of str): Weight store columns to tile, all but 'd_height' if None
+
+            Returns:
+                    index (dict): The tile index, as written to index.json
+    '''
+    if columns is None:
+        columns = [c for c in store.columns if c != 'd_height']
+    os.makedirs(out_dir, exist_ok=True)
+
+    node_ids = np.array(list(G.nodes), dtype=np.int64)
+    xs = np.array([G.nodes[n]['x'] for n in node_ids])
+    ys = np.array([G.nodes[n]['y'] for n in node_ids])
+    ti, tj = tile_of(xs, ys, size)
+    node_tile = dict(zip(node_ids.tolist(), zip(ti.tolist(), tj.tolist())))
+
+    edge_tile = np.array([node_tile[u] for u in store.u.tolist()]).reshape(-1, 2)
+    target_tile = np.array([node_tile[v] for v in store.v.tolist()]).reshape(-1, 2)
+
+    index = {'size': size, 'columns': columns, 'tiles': {}}
+    for (i, j) in sorted(set(node_tile.values())):
+        in_tile = (ti == i) & (tj == j)
+        edges = np.flatnonzero((edge_tile[:, 0] == i) & (edge_tile[:, 1] == j))
+        leaving = edges[(target_tile[edges, 0] != i) | (target_tile[edges, 1] != j)]
+
+        arrays = {'node': node_ids[in_tile], 'x': xs[in_tile], 'y': ys[in_tile],
+                  'u': store.u[edges], 'v': store.v[edges], 'eid': edges}
+        for c in columns:
+            arrays[c] = store[c][edges]
+        np.savez(os.path.join(out_dir, tile_name(i, j) + '.npz'), **arrays)
+
+        index['tiles'][tile_name(i, j)] = {'nodes': int(in_tile.sum()), 'edges': len(edges), 'boundary': len(set(store.v[leaving].tolist())),
+                                           'neighbours': sorted(set(tile_name(a, b) for a, b in target_tile[leaving].tolist()))}
+
+    with open(os.path.join(out_dir, 'index.json'), 'w') as f:
+        json.dump(index, f)
+    return index
+
+class TiledGraph:
+    '''
+    A tiled travel graph whose tiles are loaded on demand and evicted least-recently-used when over budget.
+    '''
+    def __init__(self, tile_dir, budget=memory_budget):
+        with open(os.path.join(tile_dir, 'index.json')) as f:
+            self.index = json.load(f)
+        self.tile_dir = tile_dir
+        self.size = self.index['size']
+        self.budget = budget
+        self.tiles = OrderedDict()
+        self.loads = 0
+
+    def nbytes(self):
+        '''
+        Returns the memory used by the resident tiles, bytes.
+        '''
+        return sum(a.nbytes for tile in self.tiles.values() for a in tile.values())
+
+    def tile(self, name, pinned=()):
+        '''
+        Returns the arrays of a tile, loading it and evicting unpinned tiles if over budget.
+
+                Parameters:
+                        name (str): Tile name, 'i_j'
+                        pinned (collection of str): Tiles in use by the current query, never evicted
+
+                Returns:
+                        tile (dict of np.ndarray): Node and edge arrays of the tile
+        '''
+        if name in self.tiles:
+            self.tiles.move_to_end(name)
+            return self.tiles[name]
+        with np.load(os.path.join(self.tile_dir, name + '.npz')) as f:
+            self.tiles[name] = {k: f[k] for k in f.files}
+        self.loads += 1
+
+        for old in list(self.tiles.keys()):
+            if self.nbytes() <= self.budget:
+                break
+            if old != name and old not in pinned:
+                del self.tiles[old]
+        return self.tiles[name]
+
+    def corridor(self, orig, dest, margin):
+        '''
+        Returns the existing tiles within a margin of the straight line between two points.
+
+                Parameters:
+                        orig (tuple): (lat, lng) of the origin
+                        dest (tuple): (lat, lng) of the destination
+                        margin (float): Corridor half-width, degrees
+
+                Returns:
+                        names (list of str): Tiles intersecting the corridor
+        '''
+        (y0, x0), (y1, x1) = orig, dest
+        reach = margin + self.size * math.sqrt(2) / 2
+        imin, jmin = tile_of(min(x0, x1) - reach, min(y0, y1) - reach, self.size)
+        imax, jmax = tile_of(max(x0, x1) + reach, max(y0, y1) + reach, self.size)
+
+        dx, dy = x1 - x0, y1 - y0
+        norm = dx*dx + dy*dy
+        names = []
+        for i in range(imin, imax + 1):
+            for j in range(jmin, jmax + 1):
+                name = tile_name(i, j)
+                if name not in self.index['tiles']:
+                    continue
+                cx, cy = (i + 0.5) * self.size, (j + 0.5) * self.size
+                t = 0 if norm == 0 else min(max(((cx - x0)*dx + (cy - y0)*dy) / norm, 0), 1)
+                if math.hypot(cx - (x0 + t*dx), cy - (y0 + t*dy)) <= reach:
+                    names.append(name)
+        return names
+
+    def nearest_node(self, point, names):
+        '''
+        Returns the nearest node to a (lat, lng) point among the given tiles.
+        '''
+        # a degree of longitude spans cos(lat) of a degree of latitude on the ground
+        scale = math.cos(math.radians(point[0]))
+        best, best_d = None, np.inf
+        for name in names:
+            tile = self.tiles[name]
+            if len(tile['node']) == 0:
+                continue
+            d = ((tile['x'] - point[1]) * scale)**2 + (tile['y'] - point[0])**2
+            k = np.argmin(d)
+            if d[k] < best_d:
+                best, best_d = int(tile['node'][k]), d[k]
+        return best
+
+    def route(self, orig, dest, weight, margin=0.01, max_margin=0.16):
+        '''
+        Returns the lowest-cost route between two points within a corridor of tiles.
+
+        The corridor is doubled until a path is found or max_margin is exceeded. Routes
+        which would leave the corridor are not considered, so memory and time scale with
+        the corridor rather than the region.
+
+                Parameters:
+                        orig (tuple): (lat, lng) of the origin
+                        dest (tuple): (lat, lng) of the destination
+                        weight (str): Tiled column to minimise, e.g. 'rdd_a'
+                        margin (float): Initial corridor half-width, degrees
+                        max_margin (float): Widest corridor half-width tried, degrees
+
+                Returns:
+                        route (list of int): Node sequence of the route, None if not found
+                        eids (np.ndarray): WeightStore edge id of every step, None if not found
+        '''
+        while margin <= max_margin:
+            names = self.corridor(orig, dest, margin)
+            for name in names:
+                self.tile(name, pinned=names)
+
+            source = self.nearest_node(orig, names)
+            target = self.nearest_node(dest, names)
+            if source is None or target is None:
+                return None, None
+            if source == target:
+                return [source], np.empty(0, dtype=np.int64)
+
+            u = np.concatenate([self.tiles[n]['u'] for n in names])
+            v = np.concatenate([self.tiles[n]['v'] for n in names])
+            w = np.concatenate([self.tiles[n][weight] for n in names]).astype(np.float64)
+            eid = np.concatenate([self.tiles[n]['eid'] for n in names])
+
+            # only keep edges whose target is loaded, and the lightest of any parallel edges
+            nodes = np.unique(np.concatenate([self.tiles[n]['node'] for n in names]))
+            keep = np.isin(v, nodes)
+            u, v, w, eid = u[keep], v[keep], w[keep], eid[keep]
+            order = np.lexsort((w, v, u))
+            u, v, w, eid = u[order], v[order], w[order], eid[order]
+            first = np.ones(len(u), dtype=bool)
+            first[1:] = (u[1:] != u[:-1]) | (v[1:] != v[:-1])
+            u, v, w, eid = u[first], v[first], w[first], eid[first]
+
+            iu, iv = np.searchsorted(nodes, u), np.searchsorted(nodes, v)
+            graph = csr_matrix((w, (iu, iv)), shape=(len(nodes), len(nodes)))
+            s, t = np.searchsorted(nodes, source), np.searchsorted(nodes, target)
+            dist, pred = dijkstra(graph, indices=s, return_predecessors=True)
+
+            if np.isfinite(dist[t]):
+                path = [t]
+                while path[-1] != s:
+                    path.append(pred[path[-1]])
+                path = path[::-1]
+                lookup = dict(zip(zip(iu.tolist(), iv.tolist()), eid.tolist()))
+                eids = np.array([lookup[(a, b)] for a, b in zip(path[:-1], path[1:])], dtype=np.int64)
+                return [int(nodes[k]) for k in path], eids
+            margin *= 2
+        return None, None
+
+if __name__ == '__main__':
+    import osmnx as ox
+    from weight_store import WeightStore
+
+    if not os.path.exists(os.path.join(tile_dir, 'index.json')):
+        t0 = perf_counter()
+        G = ox.load_graphml(graph_file)
+        store = WeightStore(G)
+        store.add_profile('a', subject, ambient_pm)
+        index = build_tiles(G, store, tile_dir, columns=['length', 'rdd_a', 'energy_a', 'travel_time_a'])
+        print(f"Wrote {len(index['tiles'])} tiles in {perf_counter()-t0:.2f} s")
+        del G, store
+
+    tg = TiledGraph(tile_dir)
+    origin = (51.499824, -0.174377)
+    for distance in [0.01, 0.02, 0.05, 0.1]:
+        for _ in range(5):
+            angle = np.random.uniform(0, 2*np.pi)
+            dest = (origin[0] + distance*np.sin(angle), origin[1] + distance*np.cos(angle))
+            loads = tg.loads
+            t0 = perf_counter()
+            route, eids = tg.route(origin, dest, 'rdd_a')
+            elapsed = perf_counter() - t0
+            if route is None: continue
+            print(f"{distance:.2f} deg:\t{len(route)} nodes in {elapsed*1000:.1f} ms, {tg.loads - loads} tiles loaded, {len(tg.tiles)} resident using {tg.nbytes()/1e6:.1f} MB")
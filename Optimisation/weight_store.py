@@ -0,0 +1,160 @@
+import numpy as np
+import osmnx as ox
+
+from weights import edge_weight_arrays
+
+class WeightStore:
+    '''
+    Columnar store of per-edge routing weights, kept alongside the travel graph.
+
+    Every edge is given a stable integer id in its 'eid' attribute; each metric of
+    each profile is a float32 column indexed by that id, rather than a boxed float
+    in the edge's attribute dictionary.
+    '''
+    def __init__(self, G):
+        '''
+        Assigns edge ids and tabulates the profile-independent terms of every edge.
+
+                Parameters:
+                        G (nx.MultiDiGraph): The travel graph, with node 'elevation' and edge 'length'
+        '''
+        self.G = G
+        n = G.number_of_edges()
+        self.u = np.empty(n, dtype=np.int64)
+        self.v = np.empty(n, dtype=np.int64)
+        self.key = np.empty(n, dtype=np.int32)
+        self.columns = {'length': np.empty(n, dtype=np.float32)}
+        d_height = np.empty(n, dtype=np.float32)
+
+        elevation = dict(G.nodes(data='elevation'))
+        for i, (u, v, k, data) in enumerate(G.edges(keys=True, data=True)):
+            data['eid'] = i
+            self.u[i], self.v[i], self.key[i] = u, v, k
+            self.columns['length'][i] = data['length']
+            d_height[i] = elevation[v] - elevation[u]
+        self.columns['d_height'] = d_height
+        self.profiles = {} # column names of every profile, by profile name
+        self.speed_kph = {} # travel velocity of every profile, constant over its edges
+
+    def __len__(self):
+        return len(self.u)
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def add_column(self, name, values):
+        '''
+        Stores an array of per-edge values as a float32 column.
+
+                Parameters:
+                        name (str): Column name, e.g. 'rdd_a'
+                        values (np.ndarray): One value per edge id
+        '''
+        if len(values) != len(self):
+            raise ValueError(f"Column {name} has {len(values)} values for {len(self)} edges")
+        self.columns[name] = np.asarray(values, dtype=np.float32)
+
+    def add_profile(self, name, subject, ambient_pm):
+        '''
+        Computes and stores the energy_, rdd_ and travel_time_ columns of a subject, and records its speed.
+
+                Parameters:
+                        name (str): Suffix of the profile's columns, e.g. 'a' for 'rdd_a'
+                        subject (dict): Dictionary containing subject's physiological attributes
+                        ambient_pm (float or np.ndarray): The concentration of PM2.5 on each edge, ug/m3
+        '''
+        weights = edge_weight_arrays(self.columns['d_height'].astype(float), self.columns['length'].astype(float), subject, ambient_pm)
+        self.profiles[name] = []
+        self.speed_kph[name] = float(subject['v'])
+        for metric, values in weights.items():
+            self.add_column(metric+'_'+name, values)
+            self.profiles[name].append(metric+'_'+name)
+
+    def drop_profile(self, name):
+        '''
+        Removes every column of a profile.
+        '''
+        self.speed_kph.pop(name, None)
+        for column in self.profiles.pop(name, []):
+            self.columns.pop(column, None)
+
+    def weight(self, name):
+        '''
+        Returns a networkx weight function reading a column, taking the lightest of any parallel edges.
+
+                Parameters:
+                        name (str): Column name, e.g. 'rdd_a'
+
+                Returns:
+                        weight (function): Weight function accepted by nx/ox shortest path routines
+        '''
+        column = self.columns[name]
+        return lambda u, v, d: float(min(column[e['eid']] for e in d.values()))
+
+    def route_edges(self, route, minimize_key='length'):
+        '''
+        Returns the edge ids along a route, choosing between parallel edges as osmnx does.
+
+                Parameters:
+                        route (list of int): Node sequence of the route
+                        minimize_key (str): Column used to choose between parallel edges
+
+                Returns:
+                        eids (np.ndarray): Edge id of every step of the route
+        '''
+        column = self.columns[minimize_key]
+        return np.array([min((e['eid'] for e in self.G[u][v].values()), key=lambda i: column[i])
+                         for u, v in zip(route[:-1], route[1:])], dtype=np.int64)
+
+    def route_sum(self, route, name, minimize_key='length'):
+        '''
+        Returns the summed value of a column along a route. Equivalent of summing get_route_edge_attributes().
+
+                Parameters:
+                        route (list of int): Node sequence of the route
+                        name (str): Column name, e.g. 'rdd_a'
+                        minimize_key (str): Column used to choose between parallel edges
+
+                Returns:
+                        total (float): Summed value along the route
+        '''
+        return float(np.sum(self.columns[name][self.route_edges(route, minimize_key)], dtype=np.float64))
+
+    def attach(self, names):
+        '''
+        Copies columns into the edges' attribute dictionaries, e.g. for routines requiring attribute names.
+        '''
+        for u, v, data in self.G.edges(data=True):
+            for name in names:
+                data[name] = float(self.columns[name][data['eid']])
+
+    def detach(self, names):
+        '''
+        Removes columns previously copied into the edges' attribute dictionaries.
+        '''
+        for u, v, data in self.G.edges(data=True):
+            for name in names:
+                data.pop(name, None)
+
+    def to_graphml(self, filepath, names=None):
+        '''
+        Saves the graph to GraphML with the selected columns as edge attributes.
+
+                Parameters:
+                        filepath (str): Path of the GraphML file
+                        names (list of str): Columns to export, all profile columns if None
+        '''
+        if names is None:
+            names = [c for c in self.columns if c not in ('length', 'd_height')]
+        self.attach(names)
+        ox.save_graphml(self.G, filepath)
+        self.detach(names)
+
+    def nbytes(self):
+        '''
+        Returns the memory used by the id and column arrays, bytes.
+        '''
+        return self.u.nbytes + self.v.nbytes + self.key.nbytes + sum(c.nbytes for c in self.columns.values())
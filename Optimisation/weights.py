@@ -0,0 +1,108 @@
+import hashlib
+import json
+import numpy as np
+
+from rdd import *
+
+# BIKE PARAMS
+g = 9.81
+Cd = 0.7
+A = 0.5
+Cr = 0.001
+ro = 1.225
+n_mech = 0.97
+n_elec = 0.72
+
+# physiological attributes which define a subject's edge weights
+profile_params = ['hr_0', 'm', 'Tr', 'hr_max', 'c', 'kf', 'sex', 'v']
+
+def kph_to_mps(kmh):
+    '''
+    Returns the velocity in m/s.
+
+            Parameters:
+                    v (float): The travel velocity, km/h
+
+            Returns:
+                    v (float): The travel velocity, m/s
+    '''
+    return kmh/3600 * 1000
+
+def aero_power(v):
+    '''
+    Returns the aerodynamic drag power at a velocity, W.
+
+            Parameters:
+                    v (float or np.ndarray): The travel velocity, m/s
+
+            Returns:
+                    power (float or np.ndarray): Power lost to drag, W
+    '''
+    return 0.5 * Cd * ro * A * v**3
+
+def edge_weight_arrays(d_height, l, subject, ambient_pm, grade=None, aero=None, df=None):
+    '''
+    Returns every routing weight of many road segments for a subject.
+
+    Attributes may be (profiles, 1) columns rather than scalars, in which case every
+    weight is a (profiles, segments) array, one row per profile. Terms shared by many
+    calls, such as in a parameter sweep, may be passed in precomputed.
+
+            Parameters:
+                    d_height (np.ndarray): The change of height over each road segment, m
+                    l (np.ndarray): The length of each road segment, m
+                    subject (dict): Dictionary containing subject's physiological attributes, scalars or (profiles, 1) arrays
+                    ambient_pm (float or np.ndarray): The concentration of PM2.5 on each segment, ug/m3
+                    grade (np.ndarray): d_height / l of each segment, computed if None
+                    aero (float or np.ndarray): Aerodynamic power at the subject's velocity, W, see aero_power(), computed if None
+                    df (float): Deposition fraction of inhaled PM2.5, see rdd.deposition_frac(), computed if None
+
+            Returns:
+                    weights (dict of np.ndarray): 'energy' (J), 'rdd' (ug) and 'travel_time' (s)
+    '''
+    v = kph_to_mps(np.asarray(subject['v'], dtype=float))
+    m = np.asarray(subject['m'], dtype=float)
+    if df is None:
+        df = deposition_frac(mmd)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        if grade is None:
+            grade = d_height / l
+        if aero is None:
+            aero = aero_power(v)
+        power = np.maximum(g * m * grade * v + aero + Cr * m * g * v, 0)
+        duration = l / v
+
+        # heart rate at the end of the segment without power history, rising towards steady state with time constant Tr
+        steady = subject['hr_0'] + subject['c'] * power / n_mech
+        hr = steady + (subject['hr_0'] - steady) * np.exp(-(v/l)/subject['Tr'])
+        hr = np.where(steady > subject['hr_max'], subject['hr_max'], np.where(hr < steady, hr, steady))
+
+        # rdd.calc_rdd() with the deposition fraction computed once
+        if np.ndim(subject['sex']) == 0:
+            vr = vent_rate(subject['sex'], hr)
+        else:
+            # each row takes the ventilation rate of its own profile's sex
+            sex = np.asarray(subject['sex']).reshape(-1)
+            hr = np.broadcast_to(hr, np.broadcast_shapes(hr.shape, (len(sex), 1)))
+            vr = np.empty(hr.shape)
+            for s in np.unique(sex):
+                rows = sex == s
+                vr[rows] = vent_rate(s, hr[rows])
+        rdd = vr * df * duration * ambient_pm / 1000
+
+        return {'energy': power * duration,
+                'rdd': rdd,
+                'travel_time': np.broadcast_to((l / 1000) / (np.asarray(subject['v'], dtype=float) / (60 * 60)), power.shape).copy()}
+
+def profile_key(subject):
+    '''
+    Returns a short stable hash of a subject's physiological attributes.
+
+            Parameters:
+                    subject (dict): Dictionary containing subject's physiological attributes
+
+            Returns:
+                    key (str): Hex digest identifying the profile, ignoring plotting attributes
+    '''
+    params = {p: subject[p] for p in profile_params}
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]